@@ -1,13 +1,40 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import concurrent.futures
+import datetime
+import functools
+import glob
+import hashlib
+import inspect
+import json
 import os
+import re
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
 
 DATA_DIR = "data/"
 PROCESSED_DIR = "processed/"
 
-conn = psycopg2.connect(
-    dbname="cryptodb", user="postgres", password="password", host="localhost"
-)
+# CHANGE THIS to your liking
+DB_PARAMS = {
+    "host": "localhost",
+    "database": "cryptodb",
+    "user": "postgres",
+    "password": "password"
+}
+
+EXPORT_BATCH_ROWS = 50000  #Rows per server-side cursor fetch and per Parquet row group
+EXTRACT_WORKERS = 6  #Datasets extracted at once, each on its own pooled connection
+TRANSFORM_WORKERS = max(2, (os.cpu_count() or 2) - 1)
+STATE_DIR = "processed/_state/"  #Watermark, running statistics and pending run of every dataset
+PIPELINE_STATE = "_pipeline"  #Fingerprint of every step's inputs and code at its last successful run
 
 queries = {
     "high_value": "sql/01_high_value_failed_transactions.sql",
@@ -18,35 +45,183 @@ queries = {
     "wallet_risk": "sql/06_wallet_risk_ranking.sql"
 }
 
-for name, path in queries.items():
-    with open(path, 'r') as file:
-        query = file.read()
-    df = pd.read_sql_query(query, conn)
-    df.to_csv(f"data/{name}.csv", index=False)
-    print(f"{name}.csv exported.")
+# Every row of the tables the queries read records the transaction that last wrote it (ingest_xid,
+# see migrations/007_change_tracking.sql). A dataset's watermark is the snapshot its last export read:
+# the rows that snapshot could not see are exactly the ones loaded or updated since, in any block order.
+CHANGED_SINCE = ("(ingest_xid >= pg_snapshot_xmin(%(snapshot)s::pg_snapshot) "
+                 "AND NOT pg_visible_in_snapshot(ingest_xid, %(snapshot)s::pg_snapshot))")
+SEEN_BY = "pg_visible_in_snapshot(ingest_xid, %(snapshot)s::pg_snapshot)"
+# Removed rows leave nothing for CHANGED_SINCE to find; every DELETE or TRUNCATE bumps the table's epoch
+# instead (migrations/008_source_epochs.sql). Epochs only grow, so the sum over the tables a dataset
+# reads moves whenever rows were removed from any of them, and the dataset is then rebuilt.
+EPOCH_OF = "(SELECT COALESCE(SUM(epoch), 0) FROM source_epochs WHERE table_name = ANY(%(tables)s))"
 
+# How each dataset is refreshed after the first run; tables are the ones its query reads.
+# append: result rows made of rows loaded since the watermark are added as
+#         processed/<name>/date=YYYY-MM-DD/ partitions of their timestamp column.
+# upsert: the keys changed since the watermark are re-extracted and replace their rows in
+#         processed/<name>.parquet (one row per wallet or wallet/token, so it stays small).
+DATASETS = {
+    "high_value": {
+        "mode": "append", "column": "timestamp", "tables": ["internal_transactions"],
+        "order_by": (["timestamp"], [False])
+    },
+    "eth_token_flow": {
+        "mode": "append", "column": "timestamp", "tables": ["internal_transactions", "token_transfers"],
+        "order_by": (["timestamp"], [False])
+    },
+    "internal_fund_flow": {
+        "mode": "append", "column": "timestamp", "tables": ["eth_internal_txs"],
+        "order_by": (["tx_hash", "trace_id"], [True, True])
+    },
+    "wallet_summary": {
+        "mode": "upsert", "key": "wallet_address", "tables": ["wallet_aggregates"],
+        "changed": f"SELECT hex_of(wallet_address) FROM wallet_aggregates WHERE {CHANGED_SINCE}",
+        "order_by": (["total_sent_eth"], [False])
+    },
+    "wallet_risk": {
+        "mode": "upsert", "key": "sender", "tables": ["wallet_aggregates"],
+        "changed": f"SELECT hex_of(wallet_address) FROM wallet_aggregates WHERE {CHANGED_SINCE}",
+        "order_by": (["failed_count", "high_value_count"], [False, False])
+    },
+    "token_movement": {
+        "mode": "upsert", "key": "from_address", "tables": ["token_transfers", "address_labels"],
+        "changed": f"""
+            SELECT hex_of(from_address) FROM token_transfers WHERE {CHANGED_SINCE}
+            UNION
+            SELECT hex_of(address) FROM address_labels WHERE {CHANGED_SINCE}
+        """,
+        "order_by": (["total_tokens_sent"], [False])
+    }
+}
+SNAPSHOT_PATTERN = re.compile(r"\d+:\d+:[\d,]*")
 
+# Arrow types for the PostgreSQL column types the sql/ queries return, by type OID.
+# NUMERIC is read as float, as it was after the CSV round trip.
+ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int64(),
+    23: pa.int64(),
+    700: pa.float64(),
+    701: pa.float64(),
+    1700: pa.float64(),
+    25: pa.string(),
+    1043: pa.string(),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC")
+}
+
+# Column dtypes of every dataset, applied whenever one is read back (load_dataset, load_csv) or saved.
+# Values that repeat across rows (addresses in the row datasets, transaction types, token symbols,
+# call types, trace ids, labels) are categories; unique hex strings are Arrow-backed strings;
+# counts are nullable integers and normalized ratios float32. "datetime" columns are parsed on read.
+STRING = "string[pyarrow]"
+SCHEMAS = {
+    "high_value": {
+        "tx_hash": STRING, "sender": "category", "receiver": "category", "value_eth": "float64",
+        "gas_used": "Int64", "is_error": "boolean", "tx_type": "category", "timestamp": "datetime",
+        "is_suspicious": "bool"
+    },
+    "wallet_summary": {
+        "wallet_address": STRING, "sent_count": "Int32", "total_sent_eth": "float64", "failed_sent": "Int32",
+        "max_sent": "float64", "normalized_total_sent": "float32"
+    },
+    "token_movement": {
+        "label": "category", "from_address": STRING, "sent_tx_count": "Int32", "total_tokens_sent": "float64",
+        "token_symbol": "category", "total_tokens_sent_norm": "float32"
+    },
+    "eth_token_flow": {
+        "tx_hash": "category", "sender": "category", "receiver": "category", "value_eth": "float64",
+        "token_symbol": "category", "value_token": "float64", "timestamp": "datetime",
+        "value_eth_norm": "float32", "value_token_norm": "float32"
+    },
+    "internal_fund_flow": {
+        "tx_hash": "category", "from_address": "category", "to_address": "category", "value_eth": "float64",
+        "trace_id": "category", "call_type": "category", "timestamp": "datetime", "is_large": "bool"
+    },
+    "wallet_risk": {
+        "sender": STRING, "failed_count": "Int32", "high_value_count": "Int32", "gas_flag_count": "Int32",
+        "total_tx_count": "Int32", "risk_score": "Int32"
+    }
+}
+
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "NUMERIC_AS_FLOAT",
+    lambda value, cursor: float(value) if value is not None else None
+)
 
+
+def read_query(name):
+    with open(queries[name], 'r') as file:
+        return file.read().strip().rstrip(";")
+
+
+def apply_schema(df, name):
+    schema = {column: dtype for column, dtype in SCHEMAS.get(name, {}).items() if column in df}
+    for column, dtype in schema.items():
+        if dtype == "datetime":
+            df[column] = pd.to_datetime(df[column])
+    df = df.astype({column: dtype for column, dtype in schema.items() if dtype != "datetime"})
+    # Categories read back from parquet are in the order they were written; sorted, so that
+    # sort_dataset orders category columns by value
+    for column, dtype in schema.items():
+        categories = df[column].cat.categories if dtype == "category" else None
+        if categories is not None and not categories.is_monotonic_increasing:
+            df[column] = df[column].cat.reorder_categories(categories.sort_values())
+    return df
+
+
+# data/<name>.csv is read straight into the dataset's dtypes, timestamps included
 def load_csv(filename):
-    return pd.read_csv(os.path.join(DATA_DIR, filename))
+    path = os.path.join(DATA_DIR, filename)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    columns = pd.read_csv(path, nrows=0).columns
+    schema = {column: dtype for column, dtype in SCHEMAS.get(name, {}).items() if column in columns}
+    return pd.read_csv(
+        path,
+        dtype={column: dtype for column, dtype in schema.items() if dtype != "datetime"},
+        parse_dates=[column for column, dtype in schema.items() if dtype == "datetime"]
+    )
+
 
-def transform_high_value(df):
+# The normalizing transforms divide by a column maximum over the whole result. Those maxima
+# are computed in SQL first, so each batch can be transformed on its own while streaming.
+def query_stats(conn, name, query, params=None):
+    with conn.cursor() as cursor:
+        if name == "eth_token_flow":
+            cursor.execute(f"SELECT MAX(value_eth), MAX(value_token) FROM ({query}) q", params)
+            max_eth, max_token = cursor.fetchone()
+            return {"value_eth": max_eth, "value_token": max_token}
+        if name == "wallet_summary":
+            cursor.execute(f"SELECT MAX(total_sent_eth) FROM ({query}) q", params)
+            return {"total_sent_eth": cursor.fetchone()[0]}
+        if name == "token_movement":
+            cursor.execute(f"SELECT token_symbol, MAX(total_tokens_sent) FROM ({query}) q GROUP BY token_symbol", params)
+            return {"total_tokens_sent": dict(cursor.fetchall())}
+    return {}
+
+def transform_high_value(df, stats=None):
     df["timestamp"] = pd.to_datetime(df["timestamp"])
     df["is_suspicious"] = df["tx_type"] != "Normal transaction"
     return df
 
-def transform_eth_token_flow(df):
+def transform_eth_token_flow(df, stats=None):
     df["timestamp"] = pd.to_datetime(df["timestamp"])
-    df["value_eth_norm"] = df["value_eth"] / df["value_eth"].max()
-    df["value_token_norm"] = df["value_token"] / df["value_token"].max()
+    stats = stats or {"value_eth": df["value_eth"].max(), "value_token": df["value_token"].max()}
+    df["value_eth_norm"] = df["value_eth"] / stats["value_eth"]
+    df["value_token_norm"] = df["value_token"] / stats["value_token"]
     return df
 
-def transform_token_movement(df):
-    df["total_tokens_sent_norm"] = df.groupby("token_symbol")["total_tokens_sent"] \
-                                     .transform(lambda x: x / x.max())
+def transform_token_movement(df, stats=None):
+    if stats:
+        maxima = df["token_symbol"].map(stats["total_tokens_sent"]).astype(float)
+    else:
+        maxima = df.groupby("token_symbol", dropna=False, observed=True)["total_tokens_sent"].transform("max")
+    df["total_tokens_sent_norm"] = df["total_tokens_sent"] / maxima
     return df
 
-def transform_wallet_risk(df):
+def transform_wallet_risk(df, stats=None):
     df["risk_score"] = (
         df["failed_count"] * 2 +
         df["high_value_count"] * 3 +
@@ -54,42 +229,621 @@ def transform_wallet_risk(df):
     )
     return df
 
-def transform_wallet_summary(df):
-    df["normalized_total_sent"] = df["total_sent_eth"] / df["total_sent_eth"].max()
+def transform_wallet_summary(df, stats=None):
+    stats = stats or {"total_sent_eth": df["total_sent_eth"].max()}
+    df["normalized_total_sent"] = df["total_sent_eth"] / stats["total_sent_eth"]
     return df
 
-def transform_internal_fund_flows(df):
+def transform_internal_fund_flows(df, stats=None):
     df["is_large"] = df["value_eth"] > 1
     return df
 
+transforms = {
+    "wallet_summary": transform_wallet_summary,
+    "internal_fund_flow": transform_internal_fund_flows,
+    "high_value": transform_high_value,
+    "eth_token_flow": transform_eth_token_flow,
+    "token_movement": transform_token_movement,
+    "wallet_risk": transform_wallet_risk
+}
+
 def save(df, name):
     os.makedirs(PROCESSED_DIR, exist_ok=True)
-    df.to_parquet(os.path.join(PROCESSED_DIR, f"{name}.parquet"))
+    apply_schema(df, name).to_parquet(os.path.join(PROCESSED_DIR, f"{name}.parquet"))
     print(f"Saved: {name}.parquet")
 
-def main():
 
-    wallet_df = transform_wallet_summary(load_csv("wallet_summary.csv"))
-    save(wallet_df, "wallet_summary")
+# Query columns get their type from the cursor description, so a batch where a column
+# happens to be all NULL still matches; columns added by the transform are inferred.
+# Columns in the dataset's SCHEMAS are written in its dtypes: categories as dictionaries with int32
+# indices (pandas picks narrower codes per batch), the others as the Arrow type of their dtype.
+# The pandas metadata is kept, so pd.read_parquet returns those dtypes as well.
+def arrow_schema(description, df, name):
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    source_types = {column.name: ARROW_TYPES.get(column.type_code) for column in description}
+    schema = SCHEMAS.get(name, {})
+    fields = []
+    for field in inferred:
+        arrow_type = source_types.get(field.name) or field.type
+        if schema.get(field.name) == "category":
+            arrow_type = pa.dictionary(pa.int32(), source_types.get(field.name) or pa.string())
+        elif schema.get(field.name) not in (None, "datetime"):
+            arrow_type = field.type
+        if pa.types.is_null(arrow_type):
+            arrow_type = pa.string()
+        fields.append(pa.field(field.name, arrow_type))
+    return pa.schema(fields, metadata=inferred.metadata)
 
-    fund_flow_df = transform_internal_fund_flows(load_csv("internal_fund_flow.csv"))
-    save(fund_flow_df, "internal_fund_flow")
 
-    high_value_df = transform_high_value(load_csv("high_value.csv"))
-    save(high_value_df, "high_value")
+def transform_batch(name, df, stats):
+    started = time.perf_counter()
+    df = apply_schema(transforms[name](df, stats), name)
+    return df, time.perf_counter() - started
 
-    eth_token_df = transform_eth_token_flow(load_csv("eth_token_flow.csv"))
-    save(eth_token_df, "eth_token_flow")
 
-    token_move_df = transform_token_movement(load_csv("token_movement.csv"))
-    save(token_move_df, "token_movement")
+def submit_transform(transform_pool, name, df, stats):
+    if transform_pool is None:
+        future = concurrent.futures.Future()
+        future.set_result(transform_batch(name, df, stats))
+        return future
+    return transform_pool.submit(transform_batch, name, df, stats)
 
-    risk_df = transform_wallet_risk(load_csv("wallet_risk.csv"))
-    save(risk_df, "wallet_risk")
 
+class ParquetFileSink:
+    # Written under a temporary name and moved into place on close. The name starts with "_",
+    # so readers of the partition directories (pyarrow, DuckDB globs) skip the file while it is written.
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        directory, filename = os.path.split(path)
+        self.tmp_path = os.path.join(directory, f"_{filename}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self.writer = None
+        self.schema = None
+
+    def write(self, df, description):
+        if self.writer is None:
+            self.schema = arrow_schema(description, df, self.name)
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.tmp_path)
+
+
+class PartitionedParquetSink:
+    # One part file per run in each processed/<name>/date=YYYY-MM-DD/ partition the rows fall in
+    def __init__(self, directory, column, run_id, name):
+        self.directory = directory
+        self.column = column
+        self.run_id = run_id
+        self.name = name
+        self.files = {}
+
+    def write(self, df, description):
+        if df.empty:
+            return
+        dates = pd.to_datetime(df[self.column]).dt.strftime("%Y-%m-%d").fillna("unknown")
+        for date, part in df.groupby(dates, sort=False):
+            if date not in self.files:
+                partition_dir = os.path.join(self.directory, f"date={date}")
+                os.makedirs(partition_dir, exist_ok=True)
+                self.files[date] = ParquetFileSink(os.path.join(partition_dir, f"part-{self.run_id}.parquet"), self.name)
+            self.files[date].write(part, description)
+
+    def close(self):
+        for sink in self.files.values():
+            sink.close()
+
+    def abort(self):
+        for sink in self.files.values():
+            sink.abort()
+
+
+class FrameSink:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, df, description):
+        self.frames.append(df)
+
+    def frame(self):
+        return pd.concat(self.frames, ignore_index=True)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+# Streams one query through a server-side cursor: each batch goes to the transform pool as soon as
+# it is fetched, and the transformed batches are handed to the sink in order (and appended to
+# data/<name>.csv with write_csv), so only a couple of batches are in memory at a time.
+# Returns the rows and seconds spent per stage; transform is CPU time in the pool, the rest is wall time.
+def export_query(conn, name, query, sink, params=None, stats=None, write_csv=False, transform_pool=None):
+    timing = {"rows": 0, "stats": 0.0, "extract": 0.0, "transform": 0.0, "write": 0.0}
+    csv_path = os.path.join(DATA_DIR, f"{name}.csv")
+    if write_csv:
+        os.makedirs(DATA_DIR, exist_ok=True)
+
+    def write(future, description):
+        df, transform_seconds = future.result()
+        timing["transform"] += transform_seconds
+        write_started = time.perf_counter()
+        sink.write(df, description)
+        timing["rows"] += len(df)
+        timing["write"] += time.perf_counter() - write_started
+
+    try:
+        with conn.cursor(name=f"export_{name}") as cursor:
+            cursor.itersize = EXPORT_BATCH_ROWS
+            extract_started = time.perf_counter()
+            cursor.execute(query, params)
+            timing["extract"] += time.perf_counter() - extract_started
+            pending = None
+            csv_rows = 0
+            written = False
+            while True:
+                extract_started = time.perf_counter()
+                batch = cursor.fetchmany(EXPORT_BATCH_ROWS)
+                timing["extract"] += time.perf_counter() - extract_started
+                # An empty batch is only transformed when the whole result is empty, to get a schema
+                if not batch and (pending is not None or written):
+                    break
+
+                columns = [column.name for column in cursor.description]
+                df = pd.DataFrame(batch, columns=columns)
+                if write_csv:
+                    write_started = time.perf_counter()
+                    df.to_csv(csv_path, mode='w' if csv_rows == 0 else 'a', header=csv_rows == 0, index=False)
+                    csv_rows += len(df)
+                    timing["write"] += time.perf_counter() - write_started
+
+                # The previous batch is written while this one transforms
+                future = submit_transform(transform_pool, name, df, stats)
+                if pending is not None:
+                    write(pending, cursor.description)
+                    written = True
+                pending = future
+                if not batch:
+                    break
+
+            if pending is not None:
+                write(pending, cursor.description)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        sink.abort()
+        raise
+
+    sink.close()
+    return timing
+
+
+def state_path(name):
+    return os.path.join(STATE_DIR, f"{name}.json")
+
+
+def load_state(name):
+    if os.path.exists(state_path(name)):
+        with open(state_path(name), 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(name, state):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp_path = f"{state_path(name)}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, state_path(name))
+
+
+# Drops a dataset's outputs and watermark so the next run rebuilds it from scratch
+def reset_dataset(name):
+    shutil.rmtree(os.path.join(PROCESSED_DIR, name), ignore_errors=True)
+    for path in [os.path.join(PROCESSED_DIR, f"{name}.parquet"), state_path(name)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Removes what a run that crashed before its watermark was saved left behind: its part files, since
+# the next run extracts the same rows again, and the temporary files it was still writing
+def clear_pending_run(name, state):
+    patterns = [os.path.join(PROCESSED_DIR, name, "date=*", "_part-*.tmp")]
+    if state.get("pending_run"):
+        patterns.append(os.path.join(PROCESSED_DIR, name, "date=*", f"part-{state['pending_run']}.parquet"))
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            os.remove(path)
+    state["pending_run"] = None
+
+
+# Column maxima only ever grow, so the run-wide statistics are folded from each run's increment
+def merge_stats(old, new):
+    merged = dict(old or {})
+    for key, value in new.items():
+        if isinstance(value, dict):
+            merged[key] = merge_stats(merged.get(key), value)
+        elif value is not None:
+            merged[key] = value if merged.get(key) is None else max(merged[key], value)
+    return merged
+
+
+def sort_dataset(df, name):
+    columns, ascending = DATASETS[name]["order_by"]
+    # PostgreSQL puts NULLs first when sorting descending
+    na_position = "last" if any(ascending) else "first"
+    return df.sort_values(columns, ascending=ascending, na_position=na_position, kind="stable").reset_index(drop=True)
+
+
+# The snapshot this export reads; the export connection is REPEATABLE READ, so every query of
+# the export sees the same one
+def read_snapshot(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_current_snapshot()::text")
+        return cursor.fetchone()[0]
+
+
+# Watermarks saved before change tracking (timestamps, block numbers) are not snapshots; those
+# datasets are rebuilt once
+def saved_snapshot(state):
+    watermark = state.get("watermark")
+    return watermark if isinstance(watermark, str) and SNAPSHOT_PATTERN.fullmatch(watermark) else None
+
+
+def read_epoch(conn, tables):
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT {EPOCH_OF}", {"tables": list(tables)})
+        return int(cursor.fetchone()[0])
 
-if __name__ == "__main__":
-    main()
 
+def removals_seen(name, state, epoch):
+    if state.get("epoch", 0) == epoch:
+        return True
+    print(f"{name}: rows were removed from the tables it reads, rebuilding")
+    return False
 
 
+def has_changes(conn, tables, snapshot):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT " + " OR ".join(f"EXISTS (SELECT 1 FROM {table} WHERE {CHANGED_SINCE})"
+                                              for table in tables), {"snapshot": snapshot})
+        return cursor.fetchone()[0]
+
+
+# The result rows of an append dataset that involve rows loaded since the snapshot. The query runs
+# once per table it reads, with that table narrowed to its new rows and the tables before it to the
+# rows the snapshot saw (CTEs named after the tables shadow them). Each new row of a join comes from
+# exactly one pass, also when both sides gained rows.
+def delta_query(name):
+    tables = DATASETS[name]["tables"]
+    passes = []
+    for i, table in enumerate(tables):
+        views = [f"{seen} AS (SELECT * FROM {seen} WHERE {SEEN_BY})" for seen in tables[:i]]
+        views.append(f"{table} AS (SELECT * FROM {table} WHERE {CHANGED_SINCE})")
+        passes.append(f"SELECT * FROM (WITH {', '.join(views)} {read_query(name)}) pass_{i}")
+    return " UNION ALL ".join(passes)
+
+
+def up_to_date(name, started):
+    print(f"{name}: up to date")
+    return {"rows": 0, "stats": 0.0, "extract": 0.0, "transform": 0.0, "write": 0.0,
+            "total": time.perf_counter() - started}
+
+
+# Appends the rows loaded since the watermark as date partitions. Only the increment's column maxima
+# are queried; they are merged into the dataset's state, which load_dataset() uses for the *_norm columns.
+def export_appended(conn, name, write_csv, transform_pool, run_id):
+    started = time.perf_counter()
+    spec = DATASETS[name]
+    state = load_state(name)
+    clear_pending_run(name, state)
+    high = read_snapshot(conn)
+    epoch = read_epoch(conn, spec["tables"])
+    low = saved_snapshot(state) if removals_seen(name, state, epoch) else None
+    if low is None:
+        reset_dataset(name)
+        state = {}
+
+    if low is not None and not has_changes(conn, spec["tables"], low):
+        return up_to_date(name, started)
+
+    query = read_query(name) if low is None else delta_query(name)
+    params = None if low is None else {"snapshot": low}
+
+    stats = merge_stats(state.get("stats"), query_stats(conn, name, query, params))
+    stats_seconds = time.perf_counter() - started
+
+    state["pending_run"] = run_id
+    save_state(name, state)
+    os.makedirs(os.path.join(PROCESSED_DIR, name), exist_ok=True)  #Present even while no rows qualify
+    sink = PartitionedParquetSink(os.path.join(PROCESSED_DIR, name), spec["column"], run_id, name)
+    timing = export_query(conn, name, query, sink, params, stats, write_csv, transform_pool)
+    save_state(name, {"watermark": high, "epoch": epoch, "stats": stats, "pending_run": None,
+                      "refreshed_at": datetime.datetime.now().isoformat()})
+
+    timing["stats"] = stats_seconds
+    timing["total"] = time.perf_counter() - started
+    print(f"{name}: appended {timing['rows']:,} new rows in {timing['total']:.1f}s")
+    return timing
+
+
+# Re-extracts only the keys changed since the watermark and replaces their rows in the small
+# processed/<name>.parquet, then recomputes the global columns (normalizations, risk_score) from it
+def export_upserted(conn, name, write_csv, transform_pool, run_id):
+    started = time.perf_counter()
+    spec = DATASETS[name]
+    path = os.path.join(PROCESSED_DIR, f"{name}.parquet")
+    state = load_state(name)
+    high = read_snapshot(conn)
+    epoch = read_epoch(conn, spec["tables"])
+    low = saved_snapshot(state) if os.path.exists(path) and removals_seen(name, state, epoch) else None
+
+    if low is not None and not has_changes(conn, spec["tables"], low):
+        return up_to_date(name, started)
+
+    query = read_query(name)
+    params = None
+    if low is not None:
+        with conn.cursor() as cursor:
+            cursor.execute(spec["changed"], {"snapshot": low})
+            keys = [row[0] for row in cursor.fetchall()]
+        query = f"SELECT * FROM ({query}) q WHERE {spec['key']} = ANY(%s)"
+        params = (keys,)
+    stats_seconds = time.perf_counter() - started
+
+    sink = FrameSink()
+    timing = export_query(conn, name, query, sink, params, None, write_csv, transform_pool)
+
+    merge_started = time.perf_counter()
+    delta = sink.frame()
+    if low is not None:
+        summary = pd.read_parquet(path)
+        delta = pd.concat([summary[~summary[spec["key"]].isin(keys)], delta], ignore_index=True)
+    merged = sort_dataset(apply_schema(transforms[name](delta), name), name)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    merged.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    save_state(name, {"watermark": high, "epoch": epoch, "refreshed_at": datetime.datetime.now().isoformat()})
+
+    timing["stats"] = stats_seconds
+    timing["write"] += time.perf_counter() - merge_started
+    timing["total"] = time.perf_counter() - started
+    print(f"{name}: refreshed {timing['rows']:,} changed rows ({len(merged):,} total) in {timing['total']:.1f}s")
+    return timing
+
+
+# The columns of a dataset without rows, e.g. an appended one whose exports found nothing yet
+def empty_dataset(name):
+    return apply_schema(pd.DataFrame(columns=list(SCHEMAS[name])), name)
+
+
+def part_files(name):
+    return glob.glob(os.path.join(PROCESSED_DIR, name, "date=*", "part-*.parquet"))
+
+
+# Reads a dataset the way etl.py left it, in its SCHEMAS dtypes. Appended datasets are read across their
+# partitions, and their *_norm columns are recomputed from the saved maxima (older partitions predate
+# the latest maximum).
+def load_dataset(name):
+    directory = os.path.join(PROCESSED_DIR, name)
+    if DATASETS[name]["mode"] == "upsert" or not os.path.isdir(directory):
+        return apply_schema(pd.read_parquet(os.path.join(PROCESSED_DIR, f"{name}.parquet")), name)
+    if not part_files(name):
+        return empty_dataset(name)
+
+    df = pd.read_parquet(directory).drop(columns=["date"])
+    df = transforms[name](df, load_state(name).get("stats") or None)
+    return sort_dataset(apply_schema(df, name), name)
+
+
+@contextmanager
+def pooled_connection(db_pool):
+    conn = db_pool.getconn()
+    psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, conn)
+    # One snapshot per export, from the watermark read to the last batch
+    conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    try:
+        yield conn
+    finally:
+        db_pool.putconn(conn)
+
+
+def export_dataset(db_pool, name, write_csv, transform_pool, run_id):
+    with pooled_connection(db_pool) as conn:
+        if DATASETS[name]["mode"] == "append":
+            return export_appended(conn, name, write_csv, transform_pool, run_id)
+        return export_upserted(conn, name, write_csv, transform_pool, run_id)
+
+
+def print_timings(timings, elapsed):
+    print(f"\n{'dataset':<20} {'rows':>10} {'stats s':>8} {'extract s':>10} {'transform s':>12} {'write s':>8} {'total s':>8}")
+    for name, timing in sorted(timings.items(), key=lambda item: -item[1]["total"]):
+        print(f"{name:<20} {timing['rows']:>10,} {timing['stats']:>8.2f} {timing['extract']:>10.2f} "
+              f"{timing['transform']:>12.2f} {timing['write']:>8.2f} {timing['total']:>8.2f}")
+
+    if timings:
+        name, timing = max(timings.items(), key=lambda item: item[1]["total"])
+        stage = max(["stats", "extract", "transform", "write"], key=lambda stage: timing[stage])
+        print(f"Critical path: {name} ({timing['total']:.2f}s of {elapsed:.2f}s wall, mostly {stage})")
+
+
+# Hash of the code a step runs, so that editing a query or a transform invalidates its output
+def code_version(*sources):
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(source.encode())
+    return digest.hexdigest()[:16]
+
+
+def dataset_code_version(name):
+    return code_version(read_query(name), inspect.getsource(transforms[name]))
+
+
+def has_output(name):
+    return os.path.isdir(os.path.join(PROCESSED_DIR, name)) or os.path.exists(os.path.join(PROCESSED_DIR, f"{name}.parquet"))
+
+
+# Whether any table a dataset reads has rows its last export's snapshot could not see, or had rows
+# removed since, for every dataset in one round trip. Datasets without a saved snapshot count as changed.
+def pending_changes(names):
+    states = {name: load_state(name) for name in names}
+    snapshots = {name: saved_snapshot(states[name]) for name in names}
+    checked = [name for name in names if snapshots[name]]
+    changes = {name: True for name in names}
+    if not checked:
+        return changes
+
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cursor:
+            checks = [
+                cursor.mogrify(" OR ".join([f"EXISTS (SELECT 1 FROM {table} WHERE {CHANGED_SINCE})"
+                                            for table in DATASETS[name]["tables"]] + [f"{EPOCH_OF} <> %(epoch)s"]),
+                               {"snapshot": snapshots[name], "tables": DATASETS[name]["tables"],
+                                "epoch": states[name].get("epoch", 0)}).decode()
+                for name in checked
+            ]
+            cursor.execute("SELECT " + ", ".join(f"({check})" for check in checks))
+            changes.update(zip(checked, cursor.fetchone()))
+        return changes
+    finally:
+        conn.close()
+
+
+# Fingerprint of every step: datasets by the snapshot their output was exported from ("changed" while
+# any table they read has newer rows) and their code, wallet_features by the fingerprints of the
+# datasets it is built from and its own code. Without changes, the fingerprints are read from the
+# saved states alone, as they are after a run.
+def step_fingerprints(names, changes=None):
+    import feature_store
+    changes = changes or {}
+    fingerprints = {
+        name: {
+            "source": "changed" if changes.get(name) else saved_snapshot(load_state(name)),
+            "code": dataset_code_version(name)
+        }
+        for name in names
+    }
+    fingerprints["wallet_features"] = {
+        "upstream": code_version(json.dumps(fingerprints, sort_keys=True)),
+        "code": code_version(inspect.getsource(feature_store))
+    }
+    return fingerprints
+
+
+def export_step(db_pool, name, write_csv, transform_pool, run_id, previous):
+    # Incremental output built by other code cannot be extended, so a changed step starts over,
+    # as does one whose output was removed
+    if previous.get("code") not in (None, dataset_code_version(name)):
+        print(f"{name}: query or transform changed, rebuilding")
+        reset_dataset(name)
+    elif not has_output(name):
+        reset_dataset(name)
+    return export_dataset(db_pool, name, write_csv, transform_pool, run_id)
+
+
+def features_step():
+    import feature_store
+    started = time.perf_counter()
+    features = feature_store.build_features()
+    elapsed = time.perf_counter() - started
+    return {"rows": len(features), "stats": 0.0, "extract": 0.0, "transform": elapsed, "write": 0.0, "total": elapsed}
+
+
+# Runs steps = {name: (upstream names, function)} on a thread pool, each as soon as its upstream
+# steps have finished. Steps whose upstream failed are not run and count as failed.
+def run_steps(steps, workers):
+    results = {}
+    failed = []
+    waiting = {name: ([up for up in upstream if up in steps], function) for name, (upstream, function) in steps.items()}
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while waiting or running:
+            for name, (upstream, function) in list(waiting.items()):
+                if any(up in failed for up in upstream):
+                    print(f"Skipping {name}: upstream step failed")
+                    failed.append(name)
+                    del waiting[name]
+                elif all(up in results for up in upstream):
+                    running[pool.submit(function)] = name
+                    del waiting[name]
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Error in {name}: {e}")
+                    failed.append(name)
+    return results, failed
+
+
+# Runs only the steps whose fingerprint changed since their last successful run (or whose output
+# is missing): the datasets are extracted at once over a connection pool and share one transform
+# process pool, then wallet_features is updated from them. A run where nothing changed costs
+# one change query and returns without starting any pool.
+def run_etl(names=None, write_csv=False, full=False):
+    names = names or list(transforms)
+    if full:
+        for name in names:
+            reset_dataset(name)
+    started = time.perf_counter()
+    previous = {} if full else load_state(PIPELINE_STATE).get("steps", {})
+    fingerprints = step_fingerprints(names, pending_changes(names))
+
+    def changed(name):
+        return previous.get(name) != fingerprints[name] or not has_output(name)
+
+    stale = [name for name in names if changed(name)]
+    if not stale and not changed("wallet_features"):
+        print(f"Nothing changed upstream, all steps up to date ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        return {}, []
+
+    run_id = f"{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    db_pool = psycopg2.pool.ThreadedConnectionPool(1, max(1, min(EXTRACT_WORKERS, len(stale))), **DB_PARAMS)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=TRANSFORM_WORKERS) as transform_pool:
+            steps = {
+                name: ([], functools.partial(export_step, db_pool, name, write_csv, transform_pool,
+                                             run_id, previous.get(name, {})))
+                for name in stale
+            }
+            steps["wallet_features"] = (stale, features_step)
+            timings, failed = run_steps(steps, EXTRACT_WORKERS + 1)
+    finally:
+        db_pool.closeall()
+
+    exported = step_fingerprints(names)
+    for name in timings:
+        previous[name] = exported[name]
+    save_state(PIPELINE_STATE, {"steps": previous, "refreshed_at": datetime.datetime.now().isoformat()})
+
+    print_timings(timings, time.perf_counter() - started)
+    return timings, failed
+
+
+def main():
+    # python etl.py --csv also keeps this run's raw query results in data/*.csv,
+    # --full drops every watermark and rebuilds the datasets from scratch
+    write_csv = "--csv" in sys.argv[1:]
+    full = "--full" in sys.argv[1:]
+
+    _, failed = run_etl(write_csv=write_csv, full=full)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
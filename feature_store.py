@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import glob
+import os
+import sys
+import time
+
+import etl
+from fund_flow import trace_depth
+
+FEATURES_FILE = "processed/wallet_features.parquet"
+STATE_NAME = "wallet_features"  #Kept next to the dataset watermarks in processed/_state/
+KEY = "wallet_address"
+
+# Every source is (wallet column, {feature: (column, aggregation)}) per group of features.
+# Per-wallet datasets (one row per wallet, or per wallet and token) are small: when etl.py has
+# refreshed one, its features are recomputed and only the wallets whose values changed are replaced.
+WALLET_SOURCES = {
+    "wallet_summary": [
+        ("wallet_address", {
+            "sent_count": ("sent_count", "max"),
+            "total_sent_eth": ("total_sent_eth", "max"),
+            "failed_sent": ("failed_sent", "max"),
+            "max_sent": ("max_sent", "max")
+        })
+    ],
+    "wallet_risk": [
+        ("sender", {
+            "failed_count": ("failed_count", "max"),
+            "high_value_count": ("high_value_count", "max"),
+            "gas_flag_count": ("gas_flag_count", "max"),
+            "risk_score": ("risk_score", "max")
+        })
+    ],
+    "token_movement": [
+        ("from_address", {
+            "token_tx_count": ("sent_tx_count", "sum"),
+            "token_count": ("token_symbol", "nunique"),
+            "labeled_token_count": ("label", "count")
+        })
+    ]
+}
+
+# Row datasets only ever gain rows, so their features are counts, sums and maxima that are folded
+# from the new part files alone
+ROW_SOURCES = {
+    "internal_fund_flow": [
+        ("from_address", {
+            "internal_out_count": ("value_eth", "count"),
+            "internal_out_eth": ("value_eth", "sum"),
+            "internal_out_max_eth": ("value_eth", "max"),
+            "internal_large_count": ("is_large", "sum"),
+            "internal_max_depth": ("trace_depth", "max")
+        }),
+        ("to_address", {
+            "internal_in_count": ("value_eth", "count"),
+            "internal_in_eth": ("value_eth", "sum")
+        })
+    ],
+    "eth_token_flow": [
+        ("sender", {
+            "eth_token_tx_count": ("value_eth", "count"),
+            "eth_token_eth": ("value_eth", "sum")
+        })
+    ],
+    "high_value": [
+        ("sender", {
+            "flagged_eth": ("value_eth", "sum"),
+            "flagged_max_eth": ("value_eth", "max")
+        })
+    ]
+}
+
+# How stored and new partial aggregates combine
+FOLD = {"count": "sum", "sum": "sum", "max": "max"}
+
+
+def source_columns(name):
+    groups = WALLET_SOURCES.get(name) or ROW_SOURCES[name]
+    return [feature for _, features in groups for feature in features]
+
+
+def feature_columns():
+    return [column for name in list(WALLET_SOURCES) + list(ROW_SOURCES) for column in source_columns(name)]
+
+
+# A per-wallet dataset's version is its file's modification time
+def wallet_source_version(name):
+    path = os.path.join(etl.PROCESSED_DIR, f"{name}.parquet")
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+# The files a row dataset consists of: its date partitions (without the part files of a run
+# still pending in etl.py), or the single processed/<name>.parquet written by warehouse.py
+def row_source_files(name):
+    directory = os.path.join(etl.PROCESSED_DIR, name)
+    if os.path.isdir(directory):
+        pending = etl.load_state(name).get("pending_run")
+        paths = glob.glob(os.path.join(directory, "date=*", "part-*.parquet"))
+        return sorted(path for path in paths if not pending or not path.endswith(f"part-{pending}.parquet"))
+    path = os.path.join(etl.PROCESSED_DIR, f"{name}.parquet")
+    return [f"{path}@{os.stat(path).st_mtime_ns}"] if os.path.exists(path) else []
+
+
+def read_row_files(name, files):
+    paths = [file.split("@")[0] for file in files]
+    df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    if name == "internal_fund_flow":
+        df["trace_depth"] = trace_depth(df["trace_id"])
+    return df
+
+
+# The source's features for every wallet in df, one row per wallet (vectorized groupby aggregations)
+def aggregate(name, df):
+    parts = []
+    for column, features in (WALLET_SOURCES.get(name) or ROW_SOURCES[name]):
+        grouped = df.dropna(subset=[column]).groupby(column, sort=False, observed=True)
+        part = grouped.agg(**features)
+        part.index = pd.Index(part.index.astype(str), name=KEY)
+        parts.append(part)
+    partial = pd.concat(parts, axis=1).astype(np.float64)
+    return partial
+
+
+def fold(stored, partial, name):
+    how = {feature: FOLD[aggregation] for _, features in ROW_SOURCES[name]
+           for feature, (_, aggregation) in features.items()}
+    combined = pd.concat([stored, partial])
+    return combined.groupby(level=0, sort=False).agg(how)
+
+
+def load_features():
+    features = pd.read_parquet(FEATURES_FILE)
+    return features.set_index(KEY)
+
+
+def save_features(features):
+    os.makedirs(os.path.dirname(FEATURES_FILE), exist_ok=True)
+    tmp_path = f"{FEATURES_FILE}.{os.getpid()}.tmp"
+    features.sort_index().rename_axis(KEY).reset_index().to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, FEATURES_FILE)
+
+
+# Brings processed/wallet_features.parquet up to date with processed/ and returns it, indexed by wallet.
+# Only sources that etl.py changed since the last build are read, and only the wallets they touch
+# are rewritten; a row dataset that lost files (etl.py --full) is folded again from scratch.
+def build_features(full=False):
+    started = time.perf_counter()
+    state = {} if full or not os.path.exists(FEATURES_FILE) else etl.load_state(STATE_NAME)
+    features = load_features() if state else pd.DataFrame(columns=feature_columns(), index=pd.Index([], name=KEY))
+    versions = dict(state.get("versions", {}))
+    touched = pd.Index([], name=KEY)
+
+    for name in WALLET_SOURCES:
+        version = wallet_source_version(name)
+        if version is None or versions.get(name) == version:
+            continue
+        update = aggregate(name, etl.load_dataset(name))
+        columns = source_columns(name)
+        wallets = features.index.union(update.index)
+        features = features.reindex(wallets)
+        stored = features[columns].fillna(0)
+        update = update.reindex(wallets).fillna(0)
+        changed = wallets[~stored.eq(update).all(axis=1).to_numpy()]
+        features.loc[changed, columns] = update.loc[changed]
+        touched = touched.union(changed)
+        versions[name] = version
+
+    for name in ROW_SOURCES:
+        files = row_source_files(name)
+        seen = set(versions.get(name, []))
+        columns = source_columns(name)
+        if not seen.issubset(files):
+            features[columns] = np.nan
+            touched = touched.union(features.index)
+            seen = set()
+        new_files = [file for file in files if file not in seen]
+        if new_files:
+            partial = aggregate(name, read_row_files(name, new_files))
+            stored = features.loc[features.index.intersection(partial.index), columns]
+            folded = fold(stored, partial, name)
+            features = features.reindex(features.index.union(folded.index))
+            features.loc[folded.index, columns] = folded[columns]
+            touched = touched.union(folded.index)
+        versions[name] = files
+
+    features = features[feature_columns()].fillna(0).astype(np.float64)
+    if touched.size or not state:
+        save_features(features)
+        etl.save_state(STATE_NAME, {"versions": versions, "wallets": len(features)})
+    print(f"Wallet features: {len(features):,} wallets x {features.shape[1]} features, "
+          f"{len(touched):,} updated in {time.perf_counter() - started:.2f}s")
+    return features
+
+
+def main():
+    # python feature_store.py          update processed/wallet_features.parquet from processed/
+    # python feature_store.py --full   rebuild it from every processed/ dataset
+    build_features(full="--full" in sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import os
+import sys
+import time
+
+import etl
+
+TRACE_SUMMARY_FILE = "processed/trace_summary.parquet"
+
+
+# large_string keeps tens of millions of ids in one contiguous Arrow array (categorical ids are decoded)
+def trace_array(trace_ids):
+    trace_ids = pd.Series(trace_ids)
+    if trace_ids.dtype == object:
+        trace_ids = trace_ids.fillna("").astype(str)
+    trace = pa.array(trace_ids, from_pandas=True)
+    trace = trace.combine_chunks() if isinstance(trace, pa.ChunkedArray) else trace
+    if pa.types.is_dictionary(trace.type):
+        trace = trace.dictionary_decode()
+    return pc.fill_null(trace.cast(pa.large_string()), "")
+
+
+# Etherscan trace ids are call paths: "0_1_1" is the second child of the first call, one level
+# below it. Depth is the number of "_" separators, as the notebook has always counted it.
+def trace_depth(trace_ids):
+    trace = trace_array(trace_ids)
+    return pc.count_substring(trace, "_").to_numpy(zero_copy_only=False).astype(np.int32)
+
+
+# Index of each call's parent row, or -1 for top-level calls. Trace ids are parsed as whole arrays,
+# and (transaction, trace id) pairs are matched as sorted integer keys. When a parent row is missing
+# (sql/05 drops small transfers), the nearest ancestor that is present is used instead.
+def parent_indices(tx_hashes, trace_ids):
+    trace = trace_array(trace_ids)
+    n = len(trace)
+    parent = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return parent
+
+    tx_codes = pd.factorize(pd.Series(tx_hashes))[0].astype(np.int64)
+    encoded = pc.dictionary_encode(trace)
+    dictionary = encoded.dictionary
+    trace_codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+
+    keys = tx_codes * len(dictionary) + trace_codes
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pending = np.flatnonzero(pc.count_substring(trace, "_").to_numpy(zero_copy_only=False) > 0)
+    ancestors = trace.take(pa.array(pending))
+    while pending.size:
+        ancestors = pc.replace_substring_regex(ancestors, r"_[^_]*$", "")
+        codes = pc.fill_null(pc.index_in(ancestors, value_set=dictionary), -1).to_numpy().astype(np.int64)
+
+        ancestor_keys = tx_codes[pending] * len(dictionary) + codes
+        positions = np.minimum(np.searchsorted(sorted_keys, ancestor_keys), n - 1)
+        found = (codes >= 0) & (sorted_keys[positions] == ancestor_keys)
+        parent[pending[found]] = order[positions[found]]
+
+        # Calls whose ancestor is also missing keep climbing until they reach the top level
+        remaining = ~found & (pc.count_substring(ancestors, "_").to_numpy(zero_copy_only=False) > 0)
+        pending = pending[remaining]
+        ancestors = ancestors.filter(pa.array(remaining))
+
+    return parent
+
+
+# Rebuilds the call tree of every transaction and adds, per call:
+#   parent_index    row of the parent call (-1 at the top level)
+#   trace_depth     number of "_" in trace_id
+#   fan_out         number of child calls
+#   children_value  ETH passed on to the child calls
+#   retained_value  value_eth - children_value, what the call kept
+#   path_value      smallest value on the path from the top-level call, i.e. the value conserved along it
+#   chain_length    consecutive value-carrying calls ending at this one
+# Each step is one vectorized pass per tree level, so the cost grows with rows, not with Python loops.
+def build_call_trees(df):
+    df = df.reset_index(drop=True).copy()
+    values = pd.to_numeric(df["value_eth"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    parent = parent_indices(df["tx_hash"], df["trace_id"])
+    depth = trace_depth(df["trace_id"])
+    has_parent = parent >= 0
+
+    fan_out = np.bincount(parent[has_parent], minlength=len(df))
+    children_value = np.bincount(parent[has_parent], weights=values[has_parent], minlength=len(df))
+
+    path_value = values.copy()
+    chain_length = (values > 0).astype(np.int64)
+    # A parent is always at a smaller depth than its children, so levels are filled top-down
+    for level in np.unique(depth[has_parent]):
+        rows = np.flatnonzero(has_parent & (depth == level))
+        parents = parent[rows]
+        path_value[rows] = np.minimum(values[rows], path_value[parents])
+        chain_length[rows] = np.where(values[rows] > 0, chain_length[parents] + 1, 0)
+
+    df["parent_index"] = parent
+    df["trace_depth"] = depth
+    df["fan_out"] = fan_out
+    df["children_value"] = children_value
+    df["retained_value"] = values - children_value
+    df["path_value"] = path_value
+    df["chain_length"] = chain_length
+    return df
+
+
+# One row per transaction: call count, depth, widest fan-out, the ETH entering at the top level,
+# the most value carried intact to a leaf call, and the longest value-carrying chain
+def summarize_transactions(trees):
+    is_leaf = trees["fan_out"].to_numpy() == 0
+    is_top = trees["parent_index"].to_numpy() < 0
+    values = pd.to_numeric(trees["value_eth"], errors="coerce").fillna(0)
+
+    grouped = pd.DataFrame({
+        "tx_hash": trees["tx_hash"],
+        "value_eth": values,
+        "top_value": np.where(is_top, values, 0.0),
+        "leaf_path_value": np.where(is_leaf, trees["path_value"], 0.0),
+        "trace_depth": trees["trace_depth"],
+        "fan_out": trees["fan_out"],
+        "chain_length": trees["chain_length"]
+    }).groupby("tx_hash", sort=False)
+
+    summary = grouped.agg(
+        call_count=("value_eth", "size"),
+        total_value=("value_eth", "sum"),
+        top_value=("top_value", "sum"),
+        conserved_value=("leaf_path_value", "max"),
+        max_depth=("trace_depth", "max"),
+        max_fan_out=("fan_out", "max"),
+        longest_chain=("chain_length", "max")
+    ).reset_index()
+    summary["conservation_ratio"] = (summary["conserved_value"] / summary["top_value"]).where(summary["top_value"] > 0, 0.0)
+    return summary.sort_values(["longest_chain", "conserved_value"], ascending=False, ignore_index=True)
+
+
+def main():
+    # python fund_flow.py              trees from processed/internal_fund_flow (flows above 0.01 ETH)
+    # python fund_flow.py --warehouse  trees from every call in warehouse/eth_internal_txs.parquet
+    started = time.perf_counter()
+    if "--warehouse" in sys.argv[1:]:
+        import warehouse
+        conn = warehouse.connect()
+        flows = conn.execute("""
+            SELECT hex_of(tx_hash) AS tx_hash, trace_id, wei_to_eth(value_wei) AS value_eth
+            FROM eth_internal_txs
+        """).df()
+        conn.close()
+    else:
+        flows = etl.load_dataset("internal_fund_flow")
+    loaded = time.perf_counter()
+
+    trees = build_call_trees(flows)
+    summary = summarize_transactions(trees)
+    built = time.perf_counter()
+
+    os.makedirs(os.path.dirname(TRACE_SUMMARY_FILE), exist_ok=True)
+    summary.to_parquet(TRACE_SUMMARY_FILE, index=False)
+    print(f"Rebuilt call trees for {len(summary):,} transactions from {len(trees):,} calls "
+          f"(load {loaded - started:.1f}s, trees {built - loaded:.1f}s)")
+    print(summary.head(10).to_string())
+    print(f"Saved: {TRACE_SUMMARY_FILE}")
+
+
+if __name__ == "__main__":
+    main()
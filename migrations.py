@@ -0,0 +1,146 @@
+import psycopg2
+import datetime
+import json
+import glob
+import os
+import re
+import sys
+import time
+
+# CHANGE THIS to your liking
+DB_PARAMS = {
+    "host": "localhost",
+    "database": "cryptodb",
+    "user": "postgres",
+    "password": "password"
+}
+
+MIGRATIONS_DIR = "migrations/"
+SQL_DIR = "sql/"
+PLAN_HISTORY_FILE = "query_plan_history.jsonl"  #One line per report run, to compare plans as the tables grow
+MIGRATION_LOCK_ID = 727274  #Advisory lock so concurrent collectors do not apply the same migration twice
+REPORT_TABLES = ["internal_transactions", "token_transfers", "eth_internal_txs", "address_labels"]
+
+
+def list_migrations():
+    migrations = []
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        name = os.path.basename(path)
+        version = int(name.split("_", 1)[0])
+        migrations.append((version, name, path))
+    return migrations
+
+
+# Applies every migration newer than the recorded schema version, each in its own transaction
+def apply_migrations(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TIMESTAMP WITHOUT TIME ZONE
+            )
+        """)
+        conn.commit()
+
+    applied = []
+    for version, name, path in list_migrations():
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cursor.fetchone():
+                conn.commit()
+                continue
+
+            with open(path, 'r') as f:
+                cursor.execute(f.read())
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                (version, name, datetime.datetime.now())
+            )
+        conn.commit()
+        applied.append(name)
+        print(f"Applied migration {name}")
+
+    return applied
+
+
+def plan_summary(plan):
+    node_types = []
+    seq_scans = []
+
+    def walk(node):
+        node_types.append(node["Node Type"])
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name"):
+            # Report partitions under their parent table
+            seq_scans.append(re.sub(r"_(p\d+|default)$", "", node["Relation Name"]))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan["Plan"])
+    return {
+        "top_node": plan["Plan"]["Node Type"],
+        "index_nodes": sorted({t for t in node_types if "Index" in t or "Bitmap" in t}),
+        "seq_scans": sorted(set(seq_scans)),
+        "rows": plan["Plan"].get("Actual Rows"),
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time")
+    }
+
+
+# Runs EXPLAIN ANALYZE on every sql/*.sql file and appends the timings to PLAN_HISTORY_FILE
+def explain_report(conn):
+    report = {"run_at": datetime.datetime.now().isoformat(), "table_rows": {}, "table_bytes": {}, "queries": {}}
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        report["schema_version"] = cursor.fetchone()[0]
+
+        for table in REPORT_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            report["table_rows"][table] = cursor.fetchone()[0]
+            # Heap, TOAST and indexes of every partition
+            cursor.execute("SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree(%s)", (table,))
+            report["table_bytes"][table] = int(cursor.fetchone()[0])
+
+        for path in sorted(glob.glob(os.path.join(SQL_DIR, "*.sql"))):
+            with open(path, 'r') as f:
+                query = f.read().strip().rstrip(";")
+            started = time.perf_counter()
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+            plan = cursor.fetchone()[0][0]
+            summary = plan_summary(plan)
+            summary["wall_ms"] = (time.perf_counter() - started) * 1000
+            report["queries"][os.path.basename(path)] = summary
+    conn.rollback()
+
+    print(f"\nSchema version {report['schema_version']}, table rows: {report['table_rows']}")
+    print("Table sizes (with indexes): " + ", ".join(
+        f"{table} {size / 1024 ** 2:.1f} MB" for table, size in report["table_bytes"].items()))
+    print(f"{'query':<42} {'exec ms':>10} {'plan ms':>9}  plan")
+    for name, summary in report["queries"].items():
+        scans = f"seq scan on {', '.join(summary['seq_scans'])}" if summary["seq_scans"] else "no seq scans"
+        indexes = ", ".join(summary["index_nodes"]) or "no index nodes"
+        print(f"{name:<42} {summary['execution_ms']:>10.1f} {summary['planning_ms']:>9.1f}  "
+              f"{summary['top_node']}; {indexes}; {scans}")
+
+    with open(PLAN_HISTORY_FILE, 'a') as f:
+        f.write(json.dumps(report) + "\n")
+    print(f"Report appended to {PLAN_HISTORY_FILE}")
+    return report
+
+
+def main():
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        applied = apply_migrations(conn)
+        if not applied:
+            print("Schema is up to date")
+        if "--report" in sys.argv:
+            explain_report(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+-- Base schema: the four tables web.py loads into
+
+CREATE TABLE IF NOT EXISTS internal_transactions (
+    tx_hash TEXT PRIMARY KEY,
+    block_number INTEGER,
+    timestamp TIMESTAMP WITHOUT TIME ZONE,
+    sender TEXT,
+    receiver TEXT,
+    value_eth NUMERIC,
+    gas BIGINT,
+    gas_used BIGINT,
+    tx_type TEXT,
+    is_error BOOLEAN
+);
+
+CREATE TABLE IF NOT EXISTS token_transfers (
+    tx_hash TEXT,
+    block_number INTEGER,
+    timestamp TIMESTAMP WITHOUT TIME ZONE,
+    token_address TEXT,
+    from_address TEXT,
+    to_address TEXT,
+    value_token NUMERIC,
+    token_name TEXT,
+    token_symbol TEXT,
+    token_decimals INTEGER,
+    PRIMARY KEY (tx_hash, token_address, from_address, to_address)
+);
+
+CREATE TABLE IF NOT EXISTS eth_internal_txs (
+    tx_hash TEXT,
+    block_number INTEGER,
+    timestamp TIMESTAMP WITHOUT TIME ZONE,
+    from_address TEXT,
+    to_address TEXT,
+    value_eth NUMERIC,
+    trace_id TEXT,
+    error TEXT,
+    call_type TEXT,
+    PRIMARY KEY (tx_hash, trace_id)
+);
+
+CREATE TABLE IF NOT EXISTS address_labels (
+    address TEXT PRIMARY KEY,
+    label TEXT,
+    category TEXT,
+    known_entity BOOLEAN,
+    first_seen TIMESTAMP WITHOUT TIME ZONE,
+    last_seen TIMESTAMP WITHOUT TIME ZONE
+);
@@ -0,0 +1,34 @@
+-- Range-partitions the three event tables by block_number (1,000,000 blocks per partition, ~4.5 months)
+-- Primary keys gain block_number because a unique key on a partitioned table must contain the partition key
+
+DO $$
+DECLARE
+    spec RECORD;
+    i INTEGER;
+BEGIN
+    FOR spec IN
+        SELECT * FROM (VALUES
+            ('internal_transactions', 'tx_hash, block_number'),
+            ('token_transfers', 'tx_hash, token_address, from_address, to_address, block_number'),
+            ('eth_internal_txs', 'tx_hash, trace_id, block_number')
+        ) AS t(table_name, primary_key)
+    LOOP
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', spec.table_name, spec.table_name || '_unpartitioned');
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS, PRIMARY KEY (%s)) PARTITION BY RANGE (block_number)',
+            spec.table_name, spec.table_name || '_unpartitioned', spec.primary_key
+        );
+
+        FOR i IN 0..29 LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)',
+                spec.table_name || '_p' || lpad(i::text, 2, '0'), spec.table_name, i * 1000000, (i + 1) * 1000000
+            );
+        END LOOP;
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', spec.table_name || '_default', spec.table_name);
+
+        EXECUTE format('INSERT INTO %I SELECT * FROM %I', spec.table_name, spec.table_name || '_unpartitioned');
+        EXECUTE format('DROP TABLE %I', spec.table_name || '_unpartitioned');
+    END LOOP;
+END
+$$;
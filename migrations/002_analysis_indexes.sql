@@ -0,0 +1,28 @@
+-- Indexes for the analysis queries in sql/
+
+-- 02 and 06 group internal_transactions by sender; the covering columns allow index-only scans
+CREATE INDEX IF NOT EXISTS idx_internal_transactions_sender
+    ON internal_transactions (sender) INCLUDE (value_eth, is_error, tx_type);
+
+-- 01 filters on tx_type and sorts by timestamp, 04 sorts the join by timestamp
+CREATE INDEX IF NOT EXISTS idx_internal_transactions_tx_type_timestamp
+    ON internal_transactions (tx_type, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_internal_transactions_timestamp
+    ON internal_transactions (timestamp DESC);
+
+-- 04 joins token_transfers.tx_hash to internal_transactions (the primary keys lead with tx_hash)
+CREATE INDEX IF NOT EXISTS idx_token_transfers_tx_hash
+    ON token_transfers (tx_hash) INCLUDE (token_symbol, value_token);
+
+-- 03 groups token_transfers by from_address and left-joins address_labels on it
+CREATE INDEX IF NOT EXISTS idx_token_transfers_from_address
+    ON token_transfers (from_address, token_symbol) INCLUDE (value_token);
+
+-- 05 filters eth_internal_txs on value_eth and reads it in (tx_hash, trace_id) order
+CREATE INDEX IF NOT EXISTS idx_eth_internal_txs_value_flows
+    ON eth_internal_txs (tx_hash, trace_id) WHERE value_eth > 0.01;
+
+-- Rows arrive roughly in block order, so BRIN indexes on block_number and timestamp stay tiny
+CREATE INDEX IF NOT EXISTS brin_internal_transactions_block ON internal_transactions USING BRIN (block_number, timestamp);
+CREATE INDEX IF NOT EXISTS brin_token_transfers_block ON token_transfers USING BRIN (block_number, timestamp);
+CREATE INDEX IF NOT EXISTS brin_eth_internal_txs_block ON eth_internal_txs USING BRIN (block_number, timestamp);
@@ -0,0 +1,34 @@
+-- Per-wallet aggregates behind sql/02 and sql/06, kept up to date by the loaders in web.py
+-- last_block is the highest block folded into each wallet's row
+
+CREATE TABLE IF NOT EXISTS wallet_aggregates (
+    wallet_address TEXT PRIMARY KEY,
+    sent_count BIGINT NOT NULL DEFAULT 0,
+    total_sent_eth NUMERIC NOT NULL DEFAULT 0,
+    failed_sent BIGINT NOT NULL DEFAULT 0,
+    max_sent NUMERIC,
+    failed_count BIGINT NOT NULL DEFAULT 0,
+    high_value_count BIGINT NOT NULL DEFAULT 0,
+    gas_flag_count BIGINT NOT NULL DEFAULT 0,
+    last_block INTEGER
+);
+
+-- Backfill from the rows that were loaded before the aggregates existed
+INSERT INTO wallet_aggregates (
+    wallet_address, sent_count, total_sent_eth, failed_sent, max_sent,
+    failed_count, high_value_count, gas_flag_count, last_block
+)
+SELECT
+    sender,
+    COUNT(*),
+    COALESCE(SUM(value_eth), 0),
+    SUM(CASE WHEN is_error THEN 1 ELSE 0 END),
+    MAX(value_eth),
+    COUNT(*) FILTER (WHERE tx_type = 'Failed transaction'),
+    COUNT(*) FILTER (WHERE tx_type = 'High value transaction'),
+    COUNT(*) FILTER (WHERE tx_type = 'High gas consumption'),
+    MAX(block_number)
+FROM internal_transactions
+WHERE sender IS NOT NULL
+GROUP BY sender
+ON CONFLICT (wallet_address) DO NOTHING;
@@ -0,0 +1,61 @@
+-- Compact storage: addresses and hashes as 20/32-byte BYTEA instead of 42/66-character hex TEXT,
+-- ETH amounts as exact integer wei and token amounts as raw integer units (scaled by token_decimals).
+-- web.py converts on write; the sql/ queries convert back with the functions below, so their
+-- output (and everything etl.py builds from it) keeps the original hex strings and decimal amounts.
+
+CREATE OR REPLACE FUNCTION hex_to_bytea(value TEXT) RETURNS BYTEA
+    LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    AS $$ SELECT CASE WHEN value = '' THEN ''::BYTEA ELSE decode(substr(value, 3), 'hex') END $$;
+
+-- Empty values (e.g. the receiver of a contract creation) round-trip as ''
+CREATE OR REPLACE FUNCTION hex_of(value BYTEA) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    AS $$ SELECT CASE WHEN length(value) = 0 THEN '' ELSE '0x' || encode(value, 'hex') END $$;
+
+-- Multiplying keeps every digit; NUMERIC division would round to about 16 significant digits
+CREATE OR REPLACE FUNCTION wei_to_eth(value NUMERIC) RETURNS NUMERIC
+    LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    AS $$ SELECT value * 0.000000000000000001 $$;
+
+CREATE OR REPLACE FUNCTION scale_token(value NUMERIC, decimals INTEGER) RETURNS NUMERIC
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT value * power(10::NUMERIC, -COALESCE(decimals, 18)) $$;
+
+-- The partial index predicate is written in ETH, recreated below in wei
+DROP INDEX IF EXISTS idx_eth_internal_txs_value_flows;
+
+ALTER TABLE internal_transactions RENAME COLUMN value_eth TO value_wei;
+ALTER TABLE internal_transactions
+    ALTER COLUMN tx_hash TYPE BYTEA USING hex_to_bytea(tx_hash),
+    ALTER COLUMN sender TYPE BYTEA USING hex_to_bytea(sender),
+    ALTER COLUMN receiver TYPE BYTEA USING hex_to_bytea(receiver),
+    ALTER COLUMN value_wei TYPE NUMERIC(78, 0) USING round(value_wei * 1000000000000000000);
+
+ALTER TABLE token_transfers RENAME COLUMN value_token TO value_raw;
+ALTER TABLE token_transfers
+    ALTER COLUMN tx_hash TYPE BYTEA USING hex_to_bytea(tx_hash),
+    ALTER COLUMN token_address TYPE BYTEA USING hex_to_bytea(token_address),
+    ALTER COLUMN from_address TYPE BYTEA USING hex_to_bytea(from_address),
+    ALTER COLUMN to_address TYPE BYTEA USING hex_to_bytea(to_address),
+    ALTER COLUMN value_raw TYPE NUMERIC(78, 0) USING round(value_raw * power(10::NUMERIC, COALESCE(token_decimals, 18)));
+
+ALTER TABLE eth_internal_txs RENAME COLUMN value_eth TO value_wei;
+ALTER TABLE eth_internal_txs
+    ALTER COLUMN tx_hash TYPE BYTEA USING hex_to_bytea(tx_hash),
+    ALTER COLUMN from_address TYPE BYTEA USING hex_to_bytea(from_address),
+    ALTER COLUMN to_address TYPE BYTEA USING hex_to_bytea(to_address),
+    ALTER COLUMN value_wei TYPE NUMERIC(78, 0) USING round(value_wei * 1000000000000000000);
+
+ALTER TABLE address_labels
+    ALTER COLUMN address TYPE BYTEA USING hex_to_bytea(address);
+
+ALTER TABLE wallet_aggregates RENAME COLUMN total_sent_eth TO total_sent_wei;
+ALTER TABLE wallet_aggregates RENAME COLUMN max_sent TO max_sent_wei;
+ALTER TABLE wallet_aggregates
+    ALTER COLUMN wallet_address TYPE BYTEA USING hex_to_bytea(wallet_address),
+    ALTER COLUMN total_sent_wei TYPE NUMERIC(78, 0) USING round(total_sent_wei * 1000000000000000000),
+    ALTER COLUMN max_sent_wei TYPE NUMERIC(78, 0) USING round(max_sent_wei * 1000000000000000000);
+
+-- 05 keeps flows above 0.01 ETH
+CREATE INDEX IF NOT EXISTS idx_eth_internal_txs_value_flows
+    ON eth_internal_txs (tx_hash, trace_id) WHERE value_wei > 10000000000000000;
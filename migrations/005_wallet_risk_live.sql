@@ -0,0 +1,15 @@
+-- Per-wallet risk counters maintained during ingestion by web.py's LiveRiskScorer.
+-- Every collector flushes the counts of the transactions it newly loaded as increments,
+-- so workers running side by side add up. risk_score uses the weights of etl.transform_wallet_risk.
+
+CREATE TABLE IF NOT EXISTS wallet_risk_live (
+    wallet_address BYTEA PRIMARY KEY,
+    failed_count BIGINT NOT NULL DEFAULT 0,
+    high_value_count BIGINT NOT NULL DEFAULT 0,
+    high_gas_count BIGINT NOT NULL DEFAULT 0,
+    total_count BIGINT NOT NULL DEFAULT 0,
+    risk_score BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_risk_live_score ON wallet_risk_live (risk_score DESC);
@@ -0,0 +1,12 @@
+-- The classifier labels heavy transactions 'High gas consumption', but wallet_aggregates counted
+-- 'High gas transaction', so gas_flag_count stayed 0. Recount it from the stored rows.
+
+UPDATE wallet_aggregates a
+SET gas_flag_count = g.gas_flag_count
+FROM (
+    SELECT sender, COUNT(*) AS gas_flag_count
+    FROM internal_transactions
+    WHERE tx_type = 'High gas consumption' AND sender IS NOT NULL
+    GROUP BY sender
+) g
+WHERE a.wallet_address = g.sender;
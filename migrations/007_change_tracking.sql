@@ -0,0 +1,16 @@
+-- Change tracking for the incremental exports in etl.py. Every row records the transaction that
+-- last inserted or updated it; an export saves the snapshot it read, and the next one picks up
+-- exactly the rows that snapshot could not see, whatever order blocks were loaded or committed in.
+-- Rows loaded before this migration get its transaction id.
+
+ALTER TABLE internal_transactions ADD COLUMN IF NOT EXISTS ingest_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE token_transfers ADD COLUMN IF NOT EXISTS ingest_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE eth_internal_txs ADD COLUMN IF NOT EXISTS ingest_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE address_labels ADD COLUMN IF NOT EXISTS ingest_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE wallet_aggregates ADD COLUMN IF NOT EXISTS ingest_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS idx_internal_transactions_ingest_xid ON internal_transactions (ingest_xid);
+CREATE INDEX IF NOT EXISTS idx_token_transfers_ingest_xid ON token_transfers (ingest_xid);
+CREATE INDEX IF NOT EXISTS idx_eth_internal_txs_ingest_xid ON eth_internal_txs (ingest_xid);
+CREATE INDEX IF NOT EXISTS idx_address_labels_ingest_xid ON address_labels (ingest_xid);
+CREATE INDEX IF NOT EXISTS idx_wallet_aggregates_ingest_xid ON wallet_aggregates (ingest_xid);
@@ -0,0 +1,32 @@
+-- Removals from the tables etl.py exports (clear_database truncates them all) leave no rows for the
+-- ingest_xid change tracking of 007 to find. Every DELETE or TRUNCATE on them bumps the table's epoch
+-- instead; an export saves the epochs it read, and a dataset whose tables' epochs moved is rebuilt.
+
+CREATE TABLE IF NOT EXISTS source_epochs (
+    table_name TEXT PRIMARY KEY,
+    epoch BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION bump_source_epoch() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO source_epochs (table_name, epoch) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET epoch = source_epochs.epoch + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS internal_transactions_removed ON internal_transactions;
+CREATE TRIGGER internal_transactions_removed AFTER DELETE OR TRUNCATE ON internal_transactions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_source_epoch();
+DROP TRIGGER IF EXISTS token_transfers_removed ON token_transfers;
+CREATE TRIGGER token_transfers_removed AFTER DELETE OR TRUNCATE ON token_transfers
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_source_epoch();
+DROP TRIGGER IF EXISTS eth_internal_txs_removed ON eth_internal_txs;
+CREATE TRIGGER eth_internal_txs_removed AFTER DELETE OR TRUNCATE ON eth_internal_txs
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_source_epoch();
+DROP TRIGGER IF EXISTS address_labels_removed ON address_labels;
+CREATE TRIGGER address_labels_removed AFTER DELETE OR TRUNCATE ON address_labels
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_source_epoch();
+DROP TRIGGER IF EXISTS wallet_aggregates_removed ON wallet_aggregates;
+CREATE TRIGGER wallet_aggregates_removed AFTER DELETE OR TRUNCATE ON wallet_aggregates
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_source_epoch();
@@ -1,56 +1,153 @@
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import os
 
+from rate_limit import TokenBucket
+
 API_KEY = 'API_KEY'
 BASE_URL = 'https://api.etherscan.io/api'
-RATE_LIMIT_DELAY = 0.25
+REQUESTS_PER_SECOND = 4  #Shared by every lookup through one token bucket
+OSINT_WORKERS = 4  #Lookups kept in flight at once
+MAX_RETRIES = 4  #Attempts per wallet on HTTP errors, exceptions and rate-limit replies
+BACKOFF_SECONDS = 1  #Wait after the first failed attempt, doubled after every further one
+CHECKPOINT_EVERY = 50  #New labels are written to OSINT_FILE after this many results
+RELABEL_DAYS = 7  #Wallets labeled more recently than this are not fetched again
+RISK_THRESHOLD = 3
 PROCESSED_DIR = "processed/"
+OSINT_FILE = os.path.join(PROCESSED_DIR, "osint_labels.parquet")
+
+# Lowercase, since transaction addresses are compared lowercased
+KNOWN_CONTRACTS = {
+    "0x7a250d5630b4cf539739df2c5dacb4c659f2488d": "Uniswap V2",
+    "0xe592427a0aece92de3edee1f18e0157c05861564": "Uniswap V3",
+    "0xd9e1ce17f2641f24ae83637ab66a2cca9c378b9f": "Sushiswap",
+    "0x7d2768de32b0b80b7a3454c06bdac94a69ddc7a9": "Aave",
+    "0xdac17f958d2ee523a2206206994597c13d831ec7": "USDT",
+    "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48": "USDC",
+    "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2": "WETH"
+}
+
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
+
+def create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OSINT_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
+http_session = create_session()
+
+
+def label_transactions(txs):
+    for tx in txs:
+        to_addr = (tx.get("to") or "").lower()
+        if to_addr in KNOWN_CONTRACTS:
+            return f"{KNOWN_CONTRACTS[to_addr]} Interaction", "DeFi"
+    return "Unknown Wallet", "Individual"
+
+
+# Returns (label, category), or None when every attempt failed so the wallet is tried again next run
 def fetch_etherscan_labels(address):
-    try:
-        url = f"{BASE_URL}?module=account&action=txlist&address={address}&apikey={API_KEY}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        if response.status_code == 200 and data.get("status") == "1":
-            txs = data["result"]
-            known_contracts = {
-                "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D": "Uniswap V2",
-                "0xE592427A0AEce92De3Edee1F18E0157C05861564": "Uniswap V3",
-                "0xd9e1cE17f2641f24aE83637ab66a2cca9C378B9F": "Sushiswap",
-                "0x7d2768dE32b0b80b7a3454c06BdAc94A69DDc7A9": "Aave",
-                "0xdAC17F958D2ee523a2206206994597C13D831ec7": "USDT",
-                "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48": "USDC",
-                "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2": "WETH"
-            }
-            for tx in txs:
-                to_addr = tx.get("to", "").lower()
-                if to_addr in known_contracts:
-                    return f"{known_contracts[to_addr]} Interaction", "DeFi"
-            return "Unknown Wallet", "Individual"
-        return "Unknown Wallet", "Individual"
-    except Exception as e:
-        print(f"Error fetching label for {address}: {e}")
-        return "Unknown Wallet", "Individual"
-    finally:
-        time.sleep(RATE_LIMIT_DELAY)
+    params = {"module": "account", "action": "txlist", "address": address, "apikey": API_KEY}
+    for attempt in range(MAX_RETRIES):
+        try:
+            rate_limiter.acquire()
+            response = http_session.get(BASE_URL, params=params, timeout=10)
+            data = response.json()
+            if response.status_code == 200 and data.get("status") == "1":
+                return label_transactions(data["result"])
+            reply = f"{data.get('message', '')} {data.get('result', '')}".lower()
+            if response.status_code == 200 and "rate limit" not in reply:
+                return "Unknown Wallet", "Individual"  #E.g. no transactions found
+            print(f"Attempt {attempt + 1} for {address} failed: {response.status_code}, {data.get('result')}")
+        except Exception as e:
+            print(f"Attempt {attempt + 1} for {address} failed: {e}")
+        if attempt + 1 < MAX_RETRIES:
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+    print(f"Error fetching label for {address}: failed after {MAX_RETRIES} attempts")
+    return None
+
+
+def load_labels():
+    if not os.path.exists(OSINT_FILE):
+        return pd.DataFrame({
+            "sender": pd.Series(dtype=object),
+            "label": pd.Series(dtype=object),
+            "category": pd.Series(dtype=object),
+            "risk_score": pd.Series(dtype="float64"),
+            "labeled_at": pd.Series(dtype="datetime64[ns]")
+        })
+    labels = pd.read_parquet(OSINT_FILE)
+    if "labeled_at" not in labels:
+        labels["labeled_at"] = pd.NaT  #Written before labels were timestamped, fetched again
+    return labels
+
+
+def merge_labels(labels, rows):
+    if not rows:
+        return labels
+    labels = pd.concat([labels, pd.DataFrame(rows)], ignore_index=True)
+    labels = labels.drop_duplicates(subset="sender", keep="last")
+    return labels.sort_values("risk_score", ascending=False, kind="stable", ignore_index=True)
 
 
-def process_osint(wallet_risk_file):
+def save_labels(labels):
+    tmp_path = f"{OSINT_FILE}.{os.getpid()}.tmp"
+    labels.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, OSINT_FILE)
+
+
+# Labels every wallet with risk_score above RISK_THRESHOLD, highest risk first. Lookups run on a
+# thread pool under one shared rate limit; results are checkpointed to OSINT_FILE as they arrive,
+# so an interrupted pass keeps its labels and the next run continues with the remaining wallets.
+def process_osint(wallet_risk_file, workers=OSINT_WORKERS):
     try:
         df = pd.read_parquet(wallet_risk_file)
-        suspicious_wallets = df[df["risk_score"] > 3]["sender"].unique()
-        osint_data = []
-        for addr in suspicious_wallets:
-            label, category = fetch_etherscan_labels(addr)
-            osint_data.append({"sender": addr, "label": label, "category": category})
-            print(f"Processed OSINT for {addr}: {label}, {category}")
-        osint_df = pd.DataFrame(osint_data)
-        osint_df.to_parquet(os.path.join(PROCESSED_DIR, "osint_labels.parquet"))
-        print("Saved: osint_labels.parquet")
-        return osint_df
+        flagged = df[df["risk_score"] > RISK_THRESHOLD].groupby("sender", observed=True)["risk_score"].max()
+        flagged.index = flagged.index.astype(str)
+        flagged = flagged.sort_values(ascending=False, kind="stable")
+
+        labels = load_labels()
+        recent = labels["labeled_at"] > pd.Timestamp.now() - pd.Timedelta(days=RELABEL_DAYS)
+        done = set(labels.loc[recent, "sender"])
+        todo = [(addr, score) for addr, score in flagged.items() if addr not in done]
+        print(f"{len(flagged)} flagged wallets, {len(flagged) - len(todo)} labeled in the last {RELABEL_DAYS} days, "
+              f"labeling {len(todo)}")
+
+        started = time.perf_counter()
+        pending = []
+        labeled = 0
+        failed = 0
+        # The pool takes submissions in order, so the highest-risk wallets are looked up first
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(fetch_etherscan_labels, addr): (addr, score) for addr, score in todo}
+            for future in as_completed(futures):
+                addr, score = futures[future]
+                result = future.result()
+                if result is None:
+                    failed += 1
+                    continue
+                label, category = result
+                pending.append({"sender": addr, "label": label, "category": category,
+                                "risk_score": float(score), "labeled_at": pd.Timestamp.now()})
+                labeled += 1
+                print(f"Processed OSINT for {addr}: {label}, {category}")
+                if len(pending) >= CHECKPOINT_EVERY:
+                    labels = merge_labels(labels, pending)
+                    save_labels(labels)
+                    pending = []
+
+        labels = merge_labels(labels, pending)
+        save_labels(labels)
+        print(f"Saved: osint_labels.parquet ({labeled} labeled, {failed} failed, "
+              f"{time.perf_counter() - started:.1f}s)")
+        return labels
     except Exception as e:
         print(f"Error processing OSINT: {e}")
         return pd.DataFrame()
@@ -64,4 +161,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,48 @@
+import multiprocessing
+import threading
+import time
+
+
+# Token bucket shared by every request so that all concurrent fetches together stay within the rate
+# A capacity of 1 spaces requests evenly, a larger burst would let rate + capacity calls land within one second
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Same bucket kept in shared memory so several worker processes draw from one budget
+class SharedTokenBucket(TokenBucket):
+    def __init__(self, rate, capacity=1, context=multiprocessing):
+        self.rate = rate
+        self.capacity = capacity
+        self.state = context.Array('d', [self.capacity, time.monotonic()])
+        self.lock = context.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens = min(self.capacity, self.state[0] + (now - self.state[1]) * self.rate)
+                self.state[1] = now
+                if tokens >= 1:
+                    self.state[0] = tokens - 1
+                    return
+                self.state[0] = tokens
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,153 @@
+import concurrent.futures
+import multiprocessing
+import json
+import sys
+import time
+
+import web
+from rate_limit import SharedTokenBucket
+
+# Example job spec (see jobs/example_sweep.json):
+# {
+#     "contracts": ["uniswap_v3_router", "sushiswap_router"],   or "all", names from web.ADDRESSES
+#     "periods": ["Recent Activity"],                           or "all", names from web.TIME_PERIODS
+#     "data_types": ["transactions", "token_transfers", "internal_transactions", "traces", "wallets"],
+#     "budget": 20000,                                          API calls shared by every worker
+#     "workers": 4,
+#     "requests_per_second": 5                                  shared by every worker
+# }
+DATA_TYPES = ["transactions", "token_transfers", "internal_transactions", "traces", "wallets"]
+
+
+def load_job_spec(path):
+    with open(path, 'r') as f:
+        spec = json.load(f)
+
+    contracts = spec.get("contracts", "all")
+    if contracts == "all":
+        contracts = list(web.ADDRESSES)
+    unknown = [name for name in contracts if name not in web.ADDRESSES]
+    if unknown:
+        raise ValueError(f"Unknown contracts in job spec: {unknown}")
+
+    periods_by_name = {period["name"]: period for period in web.TIME_PERIODS}
+    periods = spec.get("periods", "all")
+    if periods == "all":
+        periods = list(periods_by_name)
+    unknown = [name for name in periods if name not in periods_by_name]
+    if unknown:
+        raise ValueError(f"Unknown periods in job spec: {unknown}")
+
+    data_types = spec.get("data_types", DATA_TYPES)
+    unknown = [data_type for data_type in data_types if data_type not in DATA_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown data types in job spec: {unknown}")
+
+    return {
+        "contracts": contracts,
+        "periods": periods,
+        "data_types": data_types,
+        "budget": int(spec.get("budget", web.MAX_API_CALLS_PER_DAY)),
+        "workers": int(spec.get("workers", 4)),
+        "requests_per_second": float(spec.get("requests_per_second", web.REQUESTS_PER_SECOND))
+    }
+
+
+def init_worker(shared_rate_limiter, api_call_counter, budget):
+    web.use_shared_limits(shared_rate_limiter, api_call_counter, budget)
+
+
+def rows_of(ingest):
+    return ingest.rows if ingest else 0
+
+
+# One shard is one contract x period cell, run with every requested data type
+def run_shard(contract_name, period_name, data_types):
+    address = web.ADDRESSES[contract_name]
+    period = next(period for period in web.TIME_PERIODS if period["name"] == period_name)
+    started = time.perf_counter()
+    calls_before = web.process_api_calls
+    rows = {}
+    status = "done"
+
+    try:
+        regular_ingest = None
+        if "transactions" in data_types:
+            regular_ingest = web.process_regular_transactions(address, period, track_wallets="wallets" in data_types)
+            rows["transactions"] = rows_of(regular_ingest)
+        if "token_transfers" in data_types:
+            rows["token_transfers"] = rows_of(web.process_token_transfers(address, period))
+        if "internal_transactions" in data_types:
+            rows["internal_transactions"] = rows_of(web.process_internal_transactions(address, period))
+        if "traces" in data_types and regular_ingest:
+            rows["traces"] = len(web.trace_suspicious_transactions(regular_ingest.suspicious))
+        if "wallets" in data_types and regular_ingest:
+            web.process_wallet_addresses(regular_ingest, period)
+    except SystemExit:
+        # track_api_call exits once the shared budget is spent; the task queue keeps the cursor for the next job
+        status = "budget exhausted"
+    except Exception as e:
+        print(f"Shard {contract_name} x {period_name} failed: {e}")
+        status = f"failed: {e}"
+
+    return {
+        "contract": contract_name,
+        "period": period_name,
+        "status": status,
+        "rows": rows,
+        "api_calls": web.process_api_calls - calls_before,
+        "elapsed": time.perf_counter() - started
+    }
+
+
+def run_job(spec):
+    web.ensure_tables_exist()
+    web.ensure_task_queue()
+    web.requeue_stale_tasks()
+    web.requeue_unfinalized_tasks()
+
+    shards = [(contract, period) for contract in spec["contracts"] for period in spec["periods"]]
+    print(f"Scheduling {len(shards)} shards over {spec['workers']} workers "
+          f"(budget {spec['budget']} calls, {spec['requests_per_second']} req/s)")
+
+    # spawn gives every worker fresh HTTP sessions, thread pools and DB pools
+    context = multiprocessing.get_context("spawn")
+    shared_rate_limiter = SharedTokenBucket(spec["requests_per_second"], context=context)
+    api_call_counter = context.Value('q', 0)
+
+    started = time.perf_counter()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=spec["workers"],
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(shared_rate_limiter, api_call_counter, spec["budget"])
+    ) as executor:
+        futures = [executor.submit(run_shard, contract, period, spec["data_types"]) for contract, period in shards]
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            total_rows = sum(result["rows"].values())
+            print(f"[{done}/{len(shards)}] {result['contract']} x {result['period']}: {result['status']}, "
+                  f"{total_rows:,} rows in {result['elapsed']:.1f}s "
+                  f"({total_rows / max(result['elapsed'], 1e-6):,.0f} rows/s, {result['api_calls']} calls) "
+                  f"- budget used {api_call_counter.value}/{spec['budget']}")
+
+    elapsed = time.perf_counter() - started
+    total_rows = sum(sum(result["rows"].values()) for result in results)
+    print(f"\nJob finished: {total_rows:,} rows, {api_call_counter.value} API calls in {elapsed:.1f}s "
+          f"({total_rows / max(elapsed, 1e-6):,.0f} rows/s, {api_call_counter.value / max(elapsed, 1e-6):.2f} calls/s)")
+    return results
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python scheduler.py <job_spec.json>")
+        sys.exit(1)
+
+    run_job(load_job_spec(sys.argv[1]))
+
+
+if __name__ == "__main__":
+    main()
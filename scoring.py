@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sklearn
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+import joblib
+import collections
+import concurrent.futures
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+
+import feature_store
+
+MODEL_DIR = "models/"  #One isolation_forest-<version>.joblib and .json per fit
+SCORES_FILE = "processed/wallet_anomaly.parquet"
+FEATURES = ["total_sent_eth", "sent_count", "failed_sent", "max_sent"]  #The notebook's model inputs
+POPULATION = "senders"  #Wallets fitted and scored: those with a wallet_summary row, as in the notebook
+CONTAMINATION = 0.05
+RANDOM_STATE = 42
+SAMPLE_ROWS = 250000  #Wallets a refit is trained on, sampled uniformly from the feature store
+SCORE_CHUNK_ROWS = 100000  #Wallets per scoring task
+SCORE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+REFIT_DAYS = 7  #Age after which the next run fits a new model
+
+_model = None  #Scaler and forest of a scoring worker
+
+
+def model_path(version, extension):
+    return os.path.join(MODEL_DIR, f"isolation_forest-{version}.{extension}")
+
+
+def latest_metadata():
+    paths = sorted(glob.glob(os.path.join(MODEL_DIR, "isolation_forest-*.json")))
+    if not paths:
+        return None
+    with open(paths[-1], 'r') as f:
+        return json.load(f)
+
+
+# The feature store also holds wallets that only received or moved tokens. Their sending features
+# are all 0, so they are left out: the notebook's model only sees wallet_summary's senders, and
+# a block of identical zero rows would shift the contamination threshold.
+def feature_batches(columns, batch_rows=SCORE_CHUNK_ROWS):
+    parquet = pq.ParquetFile(feature_store.FEATURES_FILE)
+    read = list(dict.fromkeys(columns + ["sent_count"]))
+    for batch in parquet.iter_batches(batch_size=batch_rows, columns=read):
+        df = batch.to_pandas()
+        yield df.loc[df["sent_count"] > 0, columns].reset_index(drop=True)
+
+
+def count_senders():
+    return int((pd.read_parquet(feature_store.FEATURES_FILE, columns=["sent_count"])["sent_count"] > 0).sum())
+
+
+# A uniform sample of about SAMPLE_ROWS senders, drawn batch by batch so the feature store
+# is never loaded whole
+def sample_features(features, sample_rows=SAMPLE_ROWS):
+    total = count_senders()
+    fraction = min(1.0, sample_rows / max(total, 1))
+    rng = np.random.default_rng(RANDOM_STATE)
+    samples = [batch[rng.random(len(batch)) < fraction] for batch in feature_batches(features)]
+    return pd.concat(samples, ignore_index=True).fillna(0), total
+
+
+def fit_model(features=FEATURES, sample_rows=SAMPLE_ROWS):
+    started = time.perf_counter()
+    X, total = sample_features(features, sample_rows)
+    scaler = StandardScaler()
+    model = IsolationForest(contamination=CONTAMINATION, random_state=RANDOM_STATE, n_jobs=-1)
+    model.fit(scaler.fit_transform(X))
+
+    version = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    metadata = {
+        "version": version,
+        "fitted_at": datetime.datetime.now().isoformat(),
+        "features": list(features),
+        "contamination": CONTAMINATION,
+        "population": POPULATION,
+        "random_state": RANDOM_STATE,
+        "sample_rows": len(X),
+        "total_rows": total,
+        "sklearn_version": sklearn.__version__
+    }
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    joblib.dump({"scaler": scaler, "model": model}, model_path(version, "joblib"))
+    with open(model_path(version, "json"), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Fitted model {version} on {len(X):,} of {total:,} sending wallets in {time.perf_counter() - started:.1f}s")
+    return metadata
+
+
+# A new model is fitted when there is none, when it is older than REFIT_DAYS, or when it was
+# trained on other features, another population or another scikit-learn version
+def needs_refit(metadata, features=FEATURES):
+    if metadata is None:
+        return True
+    age = datetime.datetime.now() - datetime.datetime.fromisoformat(metadata["fitted_at"])
+    return (age > datetime.timedelta(days=REFIT_DAYS) or metadata["features"] != list(features)
+            or metadata.get("population") != POPULATION or metadata["sklearn_version"] != sklearn.__version__)
+
+
+def init_worker(version):
+    global _model
+    _model = joblib.load(model_path(version, "joblib"))
+
+
+def score_chunk(df, features):
+    X = _model["scaler"].transform(df[features].fillna(0))
+    decision = _model["model"].decision_function(X)
+    return pd.DataFrame({
+        feature_store.KEY: df[feature_store.KEY],
+        "anomaly_score": np.where(decision < 0, -1, 1),  #-1 for anomalies, as fit_predict in the notebook
+        "decision_score": decision,  #Below 0 is anomalous; lower is more anomalous
+        "is_anomaly": decision < 0
+    })
+
+
+# Scores the senders of the feature store in SCORE_CHUNK_ROWS chunks on a process pool and writes
+# processed/wallet_anomaly.parquet in the same order. At most two chunks per worker are in flight,
+# so memory stays bounded however many wallets there are.
+def score_wallets(metadata, workers=SCORE_WORKERS):
+    started = time.perf_counter()
+    features = metadata["features"]
+    schema = pa.schema([
+        (feature_store.KEY, pa.string()),
+        ("anomaly_score", pa.int64()),
+        ("decision_score", pa.float64()),
+        ("is_anomaly", pa.bool_()),
+        ("model_version", pa.string())
+    ])
+    os.makedirs(os.path.dirname(SCORES_FILE), exist_ok=True)
+    tmp_path = f"{SCORES_FILE}.{os.getpid()}.tmp"
+    rows = 0
+    anomalies = 0
+
+    def write(writer, future):
+        scores = future.result().assign(model_version=metadata["version"])
+        writer.write_table(pa.Table.from_pandas(scores, schema=schema, preserve_index=False))
+        return len(scores), int(scores["is_anomaly"].sum())
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(metadata["version"],)) as pool, \
+            pq.ParquetWriter(tmp_path, schema) as writer:
+        pending = collections.deque()
+        for chunk in feature_batches([feature_store.KEY] + features):
+            if chunk.empty:
+                continue
+            pending.append(pool.submit(score_chunk, chunk, features))
+            if len(pending) >= workers * 2:
+                written, flagged = write(writer, pending.popleft())
+                rows += written
+                anomalies += flagged
+        while pending:
+            written, flagged = write(writer, pending.popleft())
+            rows += written
+            anomalies += flagged
+    os.replace(tmp_path, SCORES_FILE)
+
+    print(f"Scored {rows:,} wallets with model {metadata['version']} in {time.perf_counter() - started:.1f}s "
+          f"({anomalies:,} anomalies); saved: {SCORES_FILE}")
+    return rows, anomalies
+
+
+def load_scores():
+    return pd.read_parquet(SCORES_FILE)
+
+
+def main():
+    # python scoring.py           update the feature store, refit if due, score every wallet
+    # python scoring.py --refit   fit a new model first regardless of the latest one's age
+    feature_store.build_features()
+    metadata = latest_metadata()
+    if "--refit" in sys.argv[1:] or needs_refit(metadata):
+        metadata = fit_model()
+    score_wallets(metadata)
+
+
+if __name__ == "__main__":
+    main()
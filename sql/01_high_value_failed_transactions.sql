@@ -1,7 +1,8 @@
 -- Finds ETH transactions that failed or were high value (> 50 ETH)
 
 SELECT
-    tx_hash, sender, receiver, value_eth, gas_used, is_error, tx_type, timestamp
+    hex_of(tx_hash) AS tx_hash, hex_of(sender) AS sender, hex_of(receiver) AS receiver,
+    wei_to_eth(value_wei) AS value_eth, gas_used, is_error, tx_type, timestamp
 FROM
     internal_transactions
 WHERE
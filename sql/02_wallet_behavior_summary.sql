@@ -1,11 +1,11 @@
 -- Summarizes behavior of each wallet (tx count, total sent/received, errors)
+-- Reads the per-wallet aggregates that web.py maintains as transactions are loaded
 
 SELECT
-    sender AS wallet_address,
-    COUNT(*) AS sent_count,
-    SUM(value_eth) AS total_sent_eth,
-    SUM(CASE WHEN is_error THEN 1 ELSE 0 END) AS failed_sent,
-    MAX(value_eth) AS max_sent
-FROM internal_transactions
-GROUP BY sender
-ORDER BY total_sent_eth DESC;
+    hex_of(wallet_address) AS wallet_address,
+    sent_count,
+    wei_to_eth(total_sent_wei) AS total_sent_eth,
+    failed_sent,
+    wei_to_eth(max_sent_wei) AS max_sent
+FROM wallet_aggregates
+ORDER BY total_sent_wei DESC;
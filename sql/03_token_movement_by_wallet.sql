@@ -2,9 +2,9 @@
 
 SELECT
     a.label,
-    t.from_address,
+    hex_of(t.from_address) AS from_address,
     COUNT(*) AS sent_tx_count,
-    SUM(value_token) AS total_tokens_sent,
+    SUM(scale_token(value_raw, token_decimals)) AS total_tokens_sent,
     t.token_symbol
 FROM
     token_transfers t
@@ -1,12 +1,12 @@
 -- Joins ETH + token flows to find txs where both occurred
 
 SELECT
-    it.tx_hash,
-    it.sender,
-    it.receiver,
-    it.value_eth,
+    hex_of(it.tx_hash) AS tx_hash,
+    hex_of(it.sender) AS sender,
+    hex_of(it.receiver) AS receiver,
+    wei_to_eth(it.value_wei) AS value_eth,
     tt.token_symbol,
-    tt.value_token,
+    scale_token(tt.value_raw, tt.token_decimals) AS value_token,
     it.timestamp
 FROM
     internal_transactions it
@@ -1,16 +1,16 @@
 -- Detects internal ETH flows involving the same tx hash (multi-hop patterns)
 
 SELECT
-    tx_hash,
-    from_address,
-    to_address,
-    value_eth,
+    hex_of(tx_hash) AS tx_hash,
+    hex_of(from_address) AS from_address,
+    hex_of(to_address) AS to_address,
+    wei_to_eth(value_wei) AS value_eth,
     trace_id,
     call_type,
     timestamp
 FROM
     eth_internal_txs
 WHERE
-    value_eth > 0.01
+    value_wei > 10000000000000000
 ORDER BY
     tx_hash, trace_id;
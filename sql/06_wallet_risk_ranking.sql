@@ -1,11 +1,11 @@
 -- Risk ranking: wallets involved in high-risk txs
+-- Reads the per-wallet aggregates that web.py maintains as transactions are loaded
 
 SELECT
-    it.sender,
-    COUNT(*) FILTER (WHERE tx_type = 'Failed transaction') AS failed_count,
-    COUNT(*) FILTER (WHERE tx_type = 'High value transaction') AS high_value_count,
-    COUNT(*) FILTER (WHERE tx_type = 'High gas transaction') AS gas_flag_count,
-    COUNT(*) AS total_tx_count
-FROM internal_transactions it
-GROUP BY it.sender
+    hex_of(wallet_address) AS sender,
+    failed_count,
+    high_value_count,
+    gas_flag_count,
+    sent_count AS total_tx_count
+FROM wallet_aggregates
 ORDER BY failed_count DESC, high_value_count DESC;
@@ -0,0 +1,90 @@
+import collections
+import os
+
+import pandas as pd
+
+import etl
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Column = collections.namedtuple("Column", ["name", "type_code"])
+
+# Result columns of sql/01_high_value_failed_transactions.sql with their PostgreSQL type OIDs
+HIGH_VALUE_COLUMNS = [
+    Column("tx_hash", 25), Column("sender", 25), Column("receiver", 25), Column("value_eth", 1700),
+    Column("gas_used", 20), Column("is_error", 16), Column("tx_type", 25), Column("timestamp", 1114)
+]
+
+
+class FakeCursor:
+    description = HIGH_VALUE_COLUMNS
+    itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchone(self):
+        return (0,) if "source_epochs" in self.query else ("100:100:",)
+
+    def fetchmany(self, size):
+        return []
+
+
+# A source database in which no row qualifies for the dataset
+class FakeConnection:
+    def cursor(self, name=None):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_empty_append_dataset_loads(monkeypatch, tmp_path):
+    monkeypatch.chdir(REPO_DIR)  #queries are read from sql/
+    monkeypatch.setattr(etl, "PROCESSED_DIR", str(tmp_path / "processed"))
+    monkeypatch.setattr(etl, "STATE_DIR", str(tmp_path / "processed" / "_state"))
+
+    etl.export_appended(FakeConnection(), "high_value", False, None, "run-1")
+    assert os.path.isdir(tmp_path / "processed" / "high_value")
+    assert etl.load_state("high_value")["watermark"] == "100:100:"
+
+    df = etl.load_dataset("high_value")
+    assert df.empty
+    assert list(df.columns) == list(etl.SCHEMAS["high_value"])
+    for column, dtype in etl.SCHEMAS["high_value"].items():
+        if dtype == "datetime":
+            assert str(df[column].dtype).startswith("datetime64")
+        else:
+            assert df[column].dtype == dtype
+
+
+def test_crashed_run_leaves_no_readable_temp_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(etl, "PROCESSED_DIR", str(tmp_path / "processed"))
+    monkeypatch.setattr(etl, "STATE_DIR", str(tmp_path / "processed" / "_state"))
+    directory = tmp_path / "processed" / "high_value"
+    rows = [("0x" + "ab" * 32, "0x" + "11" * 20, "0x" + "22" * 20, 60.0, 21000, False, "High value transaction",
+             pd.Timestamp("2024-01-01 12:00"))]
+
+    def export(run_id):
+        sink = etl.PartitionedParquetSink(str(directory), "timestamp", run_id, "high_value")
+        df = etl.transform_batch("high_value", pd.DataFrame(rows, columns=[c.name for c in HIGH_VALUE_COLUMNS]), {})[0]
+        sink.write(df, HIGH_VALUE_COLUMNS)
+        return sink
+
+    export("run-1").close()
+    export("run-2")  #Crashes before close: its file is still being written
+    assert len(list(directory.glob("date=*/*.tmp"))) == 1
+    assert len(etl.load_dataset("high_value")) == 1
+
+    etl.clear_pending_run("high_value", {"pending_run": "run-2"})
+    assert list(directory.glob("date=*/*.tmp")) == []
+    assert len(etl.load_dataset("high_value")) == 1
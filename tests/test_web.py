@@ -0,0 +1,159 @@
+import pandas as pd
+import pytest
+
+import etl
+import web
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+# eth_internal_txs kept in memory under its primary key (tx_hash, trace_id, block_number)
+@pytest.fixture
+def traced_rows(monkeypatch, tmp_path):
+    rows = {}
+
+    def insert_internal_transactions(internal_txs):
+        for tx in internal_txs:
+            row = web.internal_transaction_row(tx)
+            rows[(row[0], row[6], row[1])] = row
+        return len(internal_txs)
+
+    def get_traced_hashes(tx_hashes):
+        stored = {web.bytes_to_hex(key[0]) for key in rows}
+        return {tx_hash for tx_hash in tx_hashes if tx_hash in stored}
+
+    monkeypatch.setattr(web, "RESPONSE_STORE_DIR", str(tmp_path / "raw_store"))
+    monkeypatch.setattr(web, "insert_internal_transactions", insert_internal_transactions)
+    monkeypatch.setattr(web, "get_traced_hashes", get_traced_hashes)
+    monkeypatch.setattr(web, "trace_calls_made", 0)
+    return rows
+
+
+def test_retracing_fetches_nothing(monkeypatch, traced_rows):
+    fetched = []
+
+    def api_get(params, timeout=20):
+        fetched.append(params["txhash"])
+        calls = [{"blockNumber": "19000000", "timeStamp": "1704067200", "from": "0x" + "11" * 20,
+                  "to": "0x" + "22" * 20, "value": str(i), "type": "call", "isError": "0"} for i in range(3)]
+        return FakeResponse({"status": "1", "message": "OK", "result": calls})
+
+    monkeypatch.setattr(web, "api_get", api_get)
+    suspicious = [{"hash": "0x" + f"{i:064x}"} for i in range(1, 5)]
+
+    traces = web.trace_suspicious_transactions(suspicious)
+    assert len(fetched) == 4
+    assert {tx["hash"] for tx in traces} == {tx["hash"] for tx in suspicious}
+    assert len(traced_rows) == 12  #Every call keeps its own row
+
+    fetched.clear()
+    assert web.trace_suspicious_transactions(suspicious) == []
+    assert fetched == []
+
+
+def sender(i):
+    return "0x" + f"{i:040x}"
+
+
+def test_live_risk_grows_past_capacity(monkeypatch):
+    monkeypatch.setattr(web, "RISK_FLUSH_SECONDS", 3600)  #Nothing is flushed to the database
+    scorer = web.LiveRiskScorer()
+    capacity = len(scorer.counts)
+
+    # More new senders in one batch than fit, then more again in a second batch
+    scorer.update([{"from": sender(i), "flag_reason": "High value transaction"} for i in range(capacity + 100)])
+    scorer.update([{"from": sender(i), "flag_reason": "Failed transaction"} for i in range(capacity - 50, capacity + 300)])
+
+    assert len(scorer.addresses) == capacity + 300
+    scores = scorer.scores()
+    assert (scores[:capacity - 50] == 3).all()
+    assert (scores[capacity - 50:capacity + 100] == 5).all()
+    assert (scores[capacity + 100:] == 2).all()
+    assert (scorer.counts[:, -1].sum()) == capacity + 100 + 350
+    assert not scorer.counts[len(scorer.addresses):].any()
+    assert not scorer.flushed.any()
+
+
+def test_live_risk_matches_etl_risk_score(monkeypatch, tmp_path):
+    monkeypatch.setattr(web, "RISK_FLUSH_SECONDS", 3600)
+    monkeypatch.setattr(web, "RULES_FILE", str(tmp_path / "no_rules.json"))  #Default thresholds
+
+    def tx(i, sender_id, value_eth=0, failed=False, gas_used=21000):
+        return {"hash": "0x" + f"{i:064x}", "blockNumber": str(19000000 + i), "timeStamp": "1704067200",
+                "from": sender(sender_id), "to": "0x" + "22" * 20, "value": str(int(value_eth * 10**18)),
+                "gas": "3000000", "gasUsed": str(gas_used), "isError": "1" if failed else "0", "input": "0x"}
+
+    # Transactions matching several weighted rules are counted once, under their flag_reason
+    transactions = [
+        tx(1, 1, failed=True, gas_used=2000000),
+        tx(2, 1, value_eth=100, gas_used=2000000),
+        tx(3, 1, value_eth=100, failed=True),
+        tx(4, 2, gas_used=2000000),
+        tx(5, 2),
+        tx(6, 3, value_eth=100, failed=True, gas_used=2000000)
+    ]
+    web.analyze_and_extract_suspicious(transactions)
+    scorer = web.LiveRiskScorer()
+    scorer.update(transactions)
+    live = dict(zip(scorer.addresses, scorer.scores().tolist()))
+
+    # wallet_aggregates' counts (WALLET_AGGREGATES_SQL) of the rows these transactions are stored as
+    rows = pd.DataFrame([web.transaction_row(t) for t in transactions],
+                        columns=["tx_hash", "block_number", "timestamp", "sender", "receiver", "value_wei",
+                                 "gas", "gas_used", "tx_type", "is_error"])
+    rows["sender"] = rows["sender"].map(web.bytes_to_hex)
+    counts = rows.groupby("sender").agg(
+        failed_count=("tx_type", lambda types: (types == "Failed transaction").sum()),
+        high_value_count=("tx_type", lambda types: (types == "High value transaction").sum()),
+        gas_flag_count=("tx_type", lambda types: (types == "High gas consumption").sum())
+    )
+    stored = etl.transform_wallet_risk(counts)["risk_score"].to_dict()
+
+    assert live == stored
+    assert len(live) == 3
+
+
+def test_unfinalized_tasks_are_fetched_again(monkeypatch, tmp_path):
+    monkeypatch.setattr(web, "TASK_DB_FILE", str(tmp_path / "tasks.sqlite"))
+    monkeypatch.setattr(web, "RESPONSE_STORE_DIR", str(tmp_path / "raw_store"))
+    monkeypatch.setattr(web, "latest_block", 19015000)
+    web.ensure_task_queue()
+    address = "0x" + "22" * 20
+    chain = [{"hash": "0x" + f"{block:064x}", "blockNumber": str(block), "timeStamp": "1704067200",
+              "from": sender(1), "to": address, "value": "0"} for block in (19001000, 19012000)]
+    fetched = []
+
+    def api_get(params, timeout=20):
+        fetched.append((params["startblock"], params["endblock"]))
+        txs = [tx for tx in chain if params["startblock"] <= int(tx["blockNumber"]) <= params["endblock"]]
+        if not txs:
+            return FakeResponse({"status": "0", "message": "No transactions found", "result": []})
+        return FakeResponse({"status": "1", "message": "OK", "result": txs})
+
+    monkeypatch.setattr(web, "api_get", api_get)
+
+    # Two segments; the second one ends past the finalized head
+    assert len(web.paginate_blocks(address, 19000000, 19019999, "txlist")) == 2
+    assert sorted(fetched) == [(19000000, 19009999), (19010000, 19019999)]  #Fetched concurrently
+
+    # A transaction lands in the unfinalized blocks and the chain moves on
+    chain.append({**chain[-1], "hash": "0x" + "ff" * 32, "blockNumber": "19016000"})
+    monkeypatch.setattr(web, "latest_block", 19100000)
+    fetched.clear()
+    web.requeue_unfinalized_tasks()
+    assert len(web.paginate_blocks(address, 19000000, 19019999, "txlist")) == 3
+    assert fetched == [(19010000, 19019999)]
+
+    # Everything is final now: the next run is read back from the store alone
+    fetched.clear()
+    web.requeue_unfinalized_tasks()
+    assert len(web.paginate_blocks(address, 19000000, 19019999, "txlist")) == 3
+    assert fetched == []
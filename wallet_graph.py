@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+import os
+import sys
+import time
+
+import etl
+import warehouse
+
+RISK_THRESHOLD = 3  #Wallets with a heuristic risk_score above this seed the expansion (as in osint.py)
+DEFAULT_HOPS = 2
+WALLET_HOPS_FILE = "processed/wallet_hops.parquet"
+
+# Every transfer between two wallets becomes one directed edge; token transfers connect wallets
+# but carry no ETH. Parallel edges are merged in DuckDB, so only distinct wallet pairs reach Python.
+EDGES_SQL = """
+    CREATE OR REPLACE TEMP TABLE graph_edges AS
+    WITH transfers AS (
+        SELECT sender AS src, receiver AS dst, wei_to_eth(value_wei) AS value FROM internal_transactions
+        UNION ALL
+        SELECT from_address, to_address, 0 FROM token_transfers
+        UNION ALL
+        SELECT from_address, to_address, wei_to_eth(value_wei) FROM eth_internal_txs
+    )
+    SELECT src, dst, SUM(value)::DOUBLE AS value, COUNT(*)::INTEGER AS transfers
+    FROM transfers
+    WHERE octet_length(src) = 20 AND octet_length(dst) = 20
+    GROUP BY src, dst
+"""
+
+# Node ids follow the sorted address order, so encoding is a binary search over a fixed-width array
+NODES_SQL = """
+    CREATE OR REPLACE TEMP TABLE graph_nodes AS
+    SELECT address, (row_number() OVER (ORDER BY address) - 1)::INTEGER AS id
+    FROM (SELECT src AS address FROM graph_edges UNION SELECT dst FROM graph_edges)
+"""
+
+
+def fixed_width(column):
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    column = column.cast(pa.binary(20))
+    return np.frombuffer(column.buffers()[1], dtype="S20", count=len(column), offset=column.offset * 20)
+
+
+def hex_to_fixed(addresses):
+    return np.array([bytes.fromhex(address[2:] if address.startswith("0x") else address)
+                     for address in pd.Series(addresses).str.lower()], dtype="S20")
+
+
+# Wallets are integer ids 0..n-1 and the edges are CSR matrices: adjacency holds transfer counts,
+# values the ETH moved over the same wallet pairs. Addresses are a sorted 20-byte array.
+# Both matrices share one index structure: about 16 bytes per distinct wallet pair plus 20 per wallet.
+class WalletGraph:
+    def __init__(self, addresses, adjacency, values):
+        self.addresses = addresses
+        self.adjacency = adjacency
+        self.values = values
+        self._reverse = None
+
+    @property
+    def reverse(self):
+        if self._reverse is None:
+            self._reverse = self.adjacency.T.tocsr()
+        return self._reverse
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def edge_count(self):
+        return self.adjacency.nnz
+
+    # Ids of the given hex addresses; addresses that are not in the graph are dropped
+    def encode(self, addresses):
+        if len(addresses) == 0 or len(self.addresses) == 0:
+            return np.array([], dtype=np.int64)
+        keys = hex_to_fixed(addresses)
+        positions = np.minimum(np.searchsorted(self.addresses, keys), len(self.addresses) - 1)
+        return np.unique(positions[self.addresses[positions] == keys])
+
+    # NumPy drops trailing zero bytes of fixed-width values when reading them back, hence the padding
+    def decode(self, ids):
+        return np.array(["0x" + address.ljust(20, b"\0").hex() for address in self.addresses[ids]], dtype=object)
+
+    def neighbours(self, ids, direction="both"):
+        parts = []
+        if direction in ("out", "both"):
+            parts.append(self.adjacency[ids].indices)
+        if direction in ("in", "both"):
+            parts.append(self.reverse[ids].indices)
+        return np.unique(np.concatenate(parts)) if parts else np.array([], dtype=np.int64)
+
+    # Breadth-first expansion: hop distance of every wallet within k hops of the seeds, -1 elsewhere.
+    # Each hop is one sparse row gather over the whole frontier.
+    def k_hop(self, seeds, k=DEFAULT_HOPS, direction="both"):
+        hops = np.full(len(self), -1, dtype=np.int32)
+        frontier = np.unique(np.asarray(seeds, dtype=np.int64))
+        hops[frontier] = 0
+        for hop in range(1, k + 1):
+            if frontier.size == 0:
+                break
+            reached = self.neighbours(frontier, direction)
+            frontier = reached[hops[reached] < 0]
+            hops[frontier] = hop
+        return hops
+
+    # Weakly connected components: number of components and the component label of every wallet
+    def components(self):
+        return connected_components(self.adjacency, directed=True, connection="weak")
+
+    # ETH and transfer count on the edges leading from any wallet in sources to any wallet in targets
+    def flow_between(self, sources, targets):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if sources.size == 0 or targets.size == 0:
+            return 0.0, 0
+        value = self.values[sources][:, targets].sum()
+        transfers = self.adjacency[sources][:, targets].sum()
+        return float(value), int(transfers)
+
+
+# Edges arrive sorted by (src, dst) and unique, so the CSR arrays are the columns themselves
+def csr_from_sorted(src, dst, data, n):
+    index_dtype = np.int32 if max(len(dst), n) < np.iinfo(np.int32).max else np.int64
+    indptr = np.zeros(n + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return sp.csr_matrix((data, dst.astype(index_dtype, copy=False), indptr), shape=(n, n), copy=False)
+
+
+def load_graph(conn=None):
+    conn = conn or warehouse.connect()
+    conn.execute(EDGES_SQL)
+    conn.execute(NODES_SQL)
+    nodes = conn.execute("SELECT address FROM graph_nodes ORDER BY id").arrow()
+    nodes = nodes.read_all() if isinstance(nodes, pa.RecordBatchReader) else nodes  #Newer DuckDB returns a reader
+    addresses = fixed_width(nodes["address"])
+    edges = conn.execute("""
+        SELECT s.id AS src, d.id AS dst, e.value, e.transfers::FLOAT AS transfers
+        FROM graph_edges e
+        JOIN graph_nodes s ON e.src = s.address
+        JOIN graph_nodes d ON e.dst = d.address
+        ORDER BY src, dst
+    """).fetchnumpy()
+    conn.execute("DROP TABLE graph_edges")
+    conn.execute("DROP TABLE graph_nodes")
+
+    n = len(addresses)
+    adjacency = csr_from_sorted(edges["src"], edges["dst"], edges["transfers"], n)
+    values = sp.csr_matrix((edges["value"], adjacency.indices, adjacency.indptr), shape=(n, n), copy=False)
+    return WalletGraph(addresses, adjacency, values)
+
+
+def flagged_wallets(risk_df=None, threshold=RISK_THRESHOLD):
+    risk_df = risk_df if risk_df is not None else etl.load_dataset("wallet_risk")
+    if "risk_score" not in risk_df:
+        risk_df = etl.transform_wallet_risk(risk_df)
+    return risk_df.loc[risk_df["risk_score"] > threshold, "sender"].dropna().tolist()
+
+
+def main():
+    # python wallet_graph.py [hops]   expands from the flagged wallets over warehouse/ (see warehouse.py --export)
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_HOPS
+
+    started = time.perf_counter()
+    graph = load_graph()
+    built = time.perf_counter()
+    print(f"Wallet graph: {len(graph):,} wallets, {graph.edge_count():,} wallet pairs in {built - started:.1f}s")
+
+    seeds = graph.encode(flagged_wallets())
+    hops = graph.k_hop(seeds, k)
+    n_components, labels = graph.components()
+    print(f"{len(seeds):,} flagged wallets; {n_components:,} weakly connected components")
+
+    previous = seeds
+    for hop in range(1, k + 1):
+        ring = np.flatnonzero(hops == hop)
+        value, transfers = graph.flow_between(previous, ring)
+        print(f"  hop {hop}: {len(ring):,} wallets, {value:,.2f} ETH in {transfers:,} transfers from hop {hop - 1}")
+        previous = ring
+
+    reached = np.flatnonzero(hops >= 0)
+    result = pd.DataFrame({
+        "address": graph.decode(reached),
+        "hops": hops[reached],
+        "component": labels[reached],
+        "component_size": np.bincount(labels)[labels[reached]]
+    }).sort_values(["hops", "component_size"], ascending=[True, False], ignore_index=True)
+
+    os.makedirs(os.path.dirname(WALLET_HOPS_FILE), exist_ok=True)
+    result.to_parquet(WALLET_HOPS_FILE, index=False)
+    print(f"Saved: {WALLET_HOPS_FILE} ({len(result):,} wallets within {k} hops, {time.perf_counter() - built:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import decimal
+import gzip
+import glob
+import json
+import os
+import sys
+import time
+
+import etl
+import web
+
+WAREHOUSE_DIR = "warehouse/"  #Base tables as Parquet, built from web.py's raw_store/
+SQL_DIR = "sql/"
+EXPORT_BATCH_ROWS = 50000  #Rows per Parquet row group while exporting the raw store
+
+# Same columns and types as the compact PostgreSQL tables (migrations/004_compact_storage.sql).
+# Wei fits DECIMAL(38, 0); raw token amounts can exceed 38 digits, so they are kept as doubles.
+TABLE_SCHEMAS = {
+    "internal_transactions": pa.schema([
+        ("tx_hash", pa.binary()),
+        ("block_number", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("sender", pa.binary()),
+        ("receiver", pa.binary()),
+        ("value_wei", pa.decimal128(38, 0)),
+        ("gas", pa.int64()),
+        ("gas_used", pa.int64()),
+        ("tx_type", pa.string()),
+        ("is_error", pa.bool_())
+    ]),
+    "token_transfers": pa.schema([
+        ("tx_hash", pa.binary()),
+        ("block_number", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("token_address", pa.binary()),
+        ("from_address", pa.binary()),
+        ("to_address", pa.binary()),
+        ("value_raw", pa.float64()),
+        ("token_name", pa.string()),
+        ("token_symbol", pa.string()),
+        ("token_decimals", pa.int64())
+    ]),
+    "eth_internal_txs": pa.schema([
+        ("tx_hash", pa.binary()),
+        ("block_number", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("from_address", pa.binary()),
+        ("to_address", pa.binary()),
+        ("value_wei", pa.decimal128(38, 0)),
+        ("trace_id", pa.string()),
+        ("error", pa.string()),
+        ("call_type", pa.string())
+    ]),
+    "address_labels": pa.schema([
+        ("address", pa.binary()),
+        ("label", pa.string()),
+        ("category", pa.string()),
+        ("known_entity", pa.bool_()),
+        ("first_seen", pa.timestamp("us")),
+        ("last_seen", pa.timestamp("us"))
+    ])
+}
+
+# Stored responses per table, with the row converter web.py loads them with and the primary key
+# the database deduplicates on (overlapping block windows are stored more than once)
+RAW_STORE_TABLES = {
+    "internal_transactions": ("txlist", web.transaction_row, ["tx_hash", "block_number"]),
+    "token_transfers": ("tokentx", web.token_transfer_row,
+                        ["tx_hash", "token_address", "from_address", "to_address", "block_number"]),
+    "eth_internal_txs": ("txlistinternal", web.internal_transaction_row, ["tx_hash", "trace_id", "block_number"])
+}
+
+# DuckDB versions of the SQL functions from migrations/004_compact_storage.sql
+MACROS = [
+    "CREATE OR REPLACE MACRO hex_of(value) AS "
+    "CASE WHEN octet_length(value) = 0 THEN '' ELSE '0x' || lower(hex(value)) END",
+    "CREATE OR REPLACE MACRO wei_to_eth(value) AS value / 1e18",
+    "CREATE OR REPLACE MACRO scale_token(value, decimals) AS value / power(10, COALESCE(decimals, 18))"
+]
+
+# wallet_aggregates is maintained by the loaders in PostgreSQL; here it is a view over the same rows
+WALLET_AGGREGATES_VIEW = """
+    CREATE OR REPLACE VIEW wallet_aggregates AS
+    SELECT
+        sender AS wallet_address,
+        COUNT(*) AS sent_count,
+        COALESCE(SUM(value_wei), 0) AS total_sent_wei,
+        SUM(CASE WHEN is_error THEN 1 ELSE 0 END) AS failed_sent,
+        MAX(value_wei) AS max_sent_wei,
+        COUNT(*) FILTER (WHERE tx_type = 'Failed transaction') AS failed_count,
+        COUNT(*) FILTER (WHERE tx_type = 'High value transaction') AS high_value_count,
+        COUNT(*) FILTER (WHERE tx_type = 'High gas consumption') AS gas_flag_count,
+        MAX(block_number) AS last_block
+    FROM internal_transactions
+    WHERE sender IS NOT NULL
+    GROUP BY sender
+"""
+
+
+def table_path(table):
+    return os.path.join(WAREHOUSE_DIR, f"{table}.parquet")
+
+
+def iter_stored_results(action):
+    action_dir = os.path.join(web.RESPONSE_STORE_DIR, "account", action)
+    for path in sorted(glob.glob(os.path.join(action_dir, "*", "*.json.gz"))):
+        try:
+            with gzip.open(path, 'rt') as f:
+                result = web.stored_result(json.load(f))
+        except Exception as e:
+            print(f"Skipping unreadable stored response {path}: {e}")
+            continue
+        if result:
+            yield result
+
+
+def arrow_batch(rows, schema):
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_decimal(field.type):
+            values = [decimal.Decimal(value) for value in values]
+        elif pa.types.is_floating(field.type):
+            values = [float(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# Converts every stored API response into warehouse/<table>.parquet with web.py's own row
+# converters (classifying regular transactions as ingestion does), keeping one row per primary key
+def export_response_store():
+    os.makedirs(WAREHOUSE_DIR, exist_ok=True)
+    conn = duckdb.connect()
+
+    for table, (action, to_row, primary_key) in RAW_STORE_TABLES.items():
+        started = time.perf_counter()
+        schema = TABLE_SCHEMAS[table]
+        staging_path = f"{table_path(table)}.{os.getpid()}.staging"
+        responses = 0
+        rows = []
+        with pq.ParquetWriter(staging_path, schema) as writer:
+            for result in iter_stored_results(action):
+                if action == "txlist":
+                    web.analyze_and_extract_suspicious(result)
+                rows.extend(web.convert_rows(result, to_row, table))
+                responses += 1
+                if len(rows) >= EXPORT_BATCH_ROWS:
+                    writer.write_table(arrow_batch(rows, schema))
+                    rows = []
+            if rows:
+                writer.write_table(arrow_batch(rows, schema))
+
+        tmp_path = f"{table_path(table)}.{os.getpid()}.tmp"
+        conn.execute(f"""
+            COPY (
+                SELECT * FROM read_parquet('{staging_path}')
+                QUALIFY row_number() OVER (PARTITION BY {', '.join(primary_key)}) = 1
+                ORDER BY block_number
+            ) TO '{tmp_path}' (FORMAT parquet, COMPRESSION zstd)
+        """)
+        os.replace(tmp_path, table_path(table))
+        os.remove(staging_path)
+
+        count = conn.execute(f"SELECT COUNT(*) FROM read_parquet('{table_path(table)}')").fetchone()[0]
+        print(f"Exported {count:,} {table} rows from {responses} stored responses "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    conn.close()
+
+
+# An in-process DuckDB database with the base tables as views over warehouse/*.parquet (a table
+# without a file is empty) and every processed/ dataset under its own name for ad-hoc queries
+# (an appended dataset without part files is empty too).
+# Queries read only the columns and row groups they need straight from the files.
+def connect():
+    conn = duckdb.connect()
+    for macro in MACROS:
+        conn.execute(macro)
+
+    for table, schema in TABLE_SCHEMAS.items():
+        if os.path.exists(table_path(table)):
+            conn.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet('{table_path(table)}')")
+        else:
+            conn.register(f"{table}_empty", schema.empty_table())
+            conn.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM {table}_empty")
+    conn.execute(WALLET_AGGREGATES_VIEW)
+
+    for name in etl.transforms:
+        directory = os.path.join(etl.PROCESSED_DIR, name)
+        path = os.path.join(etl.PROCESSED_DIR, f"{name}.parquet")
+        if os.path.isdir(directory) and etl.part_files(name):
+            conn.execute(f"CREATE OR REPLACE VIEW {name} AS "
+                         f"SELECT * EXCLUDE (date) FROM read_parquet('{directory}/*/*.parquet', hive_partitioning = true)")
+        elif os.path.isdir(directory):
+            # No export has found rows for it yet
+            conn.register(f"{name}_empty", etl.empty_dataset(name))
+            conn.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM {name}_empty")
+        elif os.path.exists(path):
+            conn.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet('{path}')")
+
+    return conn
+
+
+def run_query(conn, name):
+    with open(etl.queries[name], 'r') as f:
+        query = f.read()
+    return conn.execute(query).df()
+
+
+# Runs sql/01-06 locally and writes processed/ like etl.py does, without a database server
+def export_processed():
+    conn = connect()
+    for name, transform in etl.transforms.items():
+        started = time.perf_counter()
+        df = transform(run_query(conn, name))
+        etl.reset_dataset(name)
+        etl.save(df, name)
+        print(f"  {name}: {len(df):,} rows in {time.perf_counter() - started:.2f}s")
+    conn.close()
+
+
+def main():
+    # python warehouse.py --export        rebuild warehouse/ from raw_store/
+    # python warehouse.py --processed     run sql/01-06 over warehouse/ and write processed/
+    # python warehouse.py "SELECT ..."    ad-hoc query over warehouse/ and processed/
+    args = sys.argv[1:]
+    if "--export" in args:
+        export_response_store()
+    if "--processed" in args:
+        export_processed()
+
+    queries = [arg for arg in args if not arg.startswith("--")]
+    if queries:
+        conn = connect()
+        for query in queries:
+            started = time.perf_counter()
+            df = conn.execute(query).df()
+            print(df.to_string(max_rows=50))
+            print(f"{len(df):,} rows in {time.perf_counter() - started:.3f}s")
+        conn.close()
+    elif not args:
+        conn = connect()
+        for name in etl.queries:
+            started = time.perf_counter()
+            df = run_query(conn, name)
+            print(f"{name}: {len(df):,} rows in {time.perf_counter() - started:.3f}s")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,60 @@
 import requests
 import psycopg2
+import psycopg2.extras
+import numpy as np
+import pandas as pd
+import psycopg2.pool
 import datetime
 import time
 import sys
 import json
 import os
+import re
+import threading
+import bisect
+import io
+import gzip
+import hashlib
+import socket
+import sqlite3
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from dateutil.relativedelta import relativedelta
+from migrations import apply_migrations
+from rate_limit import TokenBucket, SharedTokenBucket
 
 API_KEY = 'API_KEY'
 BASE_URL = 'https://api.etherscan.io/api'
 
 #This is my personal limit left after testing, please modify according to your liking
 MAX_API_CALLS_PER_DAY = 98000  #These were my remaining calls
-RATE_LIMIT_DELAY = 0.25  #This is set to 4 requests per second, but etherscan actually allows 5/sec
+REQUESTS_PER_SECOND = 5  #Etherscan allows 5 requests per second, shared by every fetch through the token bucket below
+MAX_CONCURRENT_REQUESTS = 5  #Number of requests kept in flight at once
 STATE_FILE = "eth_scan_state.json"
+TASK_DB_FILE = "eth_scan_tasks.sqlite"  #Persistent queue of block-range fetch tasks, shared by every worker process
+TASK_LEASE_SECONDS = 300  #A running task without a heartbeat for this long is handed to another worker
+RESPONSE_STORE_DIR = "raw_store/"  #Every successful account response, keyed by its request parameters
+FINALITY_BLOCKS = 64  #Ranges ending this far behind the chain head are final and never re-fetched
+BLOCK_CACHE_FILE = "block_cache.json"  #Resolved timestamp -> block numbers and known (block, timestamp) anchors
+MERGE_BLOCK = 15537394  #First proof-of-stake block, from here on every slot is exactly 12 seconds
+SLOT_SECONDS = 12
+
+# Etherscan returns at most RESULT_CAP records per account query, windows hitting it are split
+RESULT_CAP = 10000
+INITIAL_BLOCK_WINDOW = 10000
+MAX_BLOCK_WINDOW = 500000
+TRACE_CALL_BUDGET = 500  #Maximum per-transaction trace calls in one run
+SPARSE_FRACTION = 0.25  #Windows returning less than this share of RESULT_CAP are widened
+DENSE_FRACTION = 0.75  #Windows returning more than this share of RESULT_CAP are narrowed
 
 # Tracking api_calls in order to avoid hitting the limit
 api_calls_made = 0
+api_calls_lock = threading.Lock()
+process_api_calls = 0  #Calls made by this process alone, api_calls_made is the shared total when workers share a budget
+shared_api_calls = None  #multiprocessing.Value installed by use_shared_limits in scheduler workers
+trace_calls_made = 0
 
 # CHANGE THIS to your liking
 DB_PARAMS = {
@@ -25,6 +63,9 @@ DB_PARAMS = {
     "user": "postgres",
     "password": "password"
 }
+DB_POOL_MAX_CONNECTIONS = 5
+COPY_BATCH_SIZE = 5000  #Rows streamed into the staging table per COPY
+PIPELINE_QUEUE_PAGES = 8  #Fetched pages buffered between the fetch and load stages before fetching blocks
 
 # LIST OF SMART CONTRACT ADDRESSES TO SELECT FROM
 # I aligned my project to focus more on swaps and some normal transactions
@@ -74,71 +115,92 @@ TOKEN_SIGNATURES = {
     "swap": "0x022c0d9f"
 }
 
+# Thresholds for analyze_and_extract_suspicious, any key can be overridden in RULES_FILE
+RULES_FILE = "suspicious_rules.json"
+SUSPICIOUS_RULES = {
+    "high_value_eth": 50,
+    "high_gas_used": 1000000,
+    "suspicious_methods": ["flashloan", "flash", "swap", "arbitrage"],
+    "method_selectors": TOKEN_SIGNATURES
+}
+
+# Online risk scoring during ingestion (LiveRiskScorer), weighted like etl.transform_wallet_risk
+RISK_WEIGHTS = {"Failed transaction": 2, "High value transaction": 3, "High gas consumption": 1}
+RISK_ALERT_THRESHOLD = 10  #A wallet whose live risk_score reaches this is reported
+RISK_FLUSH_SECONDS = 30  #Counters are written to wallet_risk_live at most this often, and when a pipeline closes
+RISK_ALERTS_FILE = "risk_alerts.jsonl"  #One line per alert
+
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
+
+# Called in each scheduler worker so that all processes share one rate limit and one API call budget
+def use_shared_limits(shared_rate_limiter, api_call_counter, max_api_calls):
+    global rate_limiter, shared_api_calls, MAX_API_CALLS_PER_DAY
+    rate_limiter = shared_rate_limiter
+    shared_api_calls = api_call_counter
+    MAX_API_CALLS_PER_DAY = max_api_calls
+
+
+def create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Pooled HTTP connections and worker threads reused by every fetch
+http_session = create_session()
+fetch_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+
+
+def api_get(params, timeout=20):
+    rate_limiter.acquire()
+    track_api_call()
+    return http_session.get(BASE_URL, params=params, timeout=timeout)
+
+
+# Runs fn over items on the fetch pool, keeping up to MAX_CONCURRENT_REQUESTS in flight, results in input order
+# Only call this with leaf fetch functions, never from inside the pool itself
+# Every item finishes before the first error is raised, so no fetch keeps running after its caller gave up
+def fetch_concurrently(fn, items):
+    futures = [fetch_pool.submit(fn, item) for item in items]
+    wait(futures)
+    return [future.result() for future in futures]
+
+
 #SQL related stuff
-def ensure_tables_exist():
-    conn = None
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
+db_pool = None
+db_pool_lock = threading.Lock()
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS internal_transactions (
-                tx_hash TEXT PRIMARY KEY,
-                block_number INTEGER,
-                timestamp TIMESTAMP WITHOUT TIME ZONE,
-                sender TEXT,
-                receiver TEXT,
-                value_eth NUMERIC,
-                gas BIGINT,
-                gas_used BIGINT,
-                tx_type TEXT,
-                is_error BOOLEAN
-            )
-        """)
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS token_transfers (
-                tx_hash TEXT,
-                block_number INTEGER,
-                timestamp TIMESTAMP WITHOUT TIME ZONE,
-                token_address TEXT,
-                from_address TEXT,
-                to_address TEXT,
-                value_token NUMERIC,
-                token_name TEXT,
-                token_symbol TEXT,
-                token_decimals INTEGER,
-                PRIMARY KEY (tx_hash, token_address, from_address, to_address)
-            )
-        """)
+def get_db_pool():
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            db_pool = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_MAX_CONNECTIONS, **DB_PARAMS)
+    return db_pool
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS eth_internal_txs (
-                tx_hash TEXT,
-                block_number INTEGER,
-                timestamp TIMESTAMP WITHOUT TIME ZONE,
-                from_address TEXT,
-                to_address TEXT,
-                value_eth NUMERIC,
-                trace_id TEXT,
-                error TEXT,
-                call_type TEXT,
-                PRIMARY KEY (tx_hash, trace_id)
-            )
-        """)
 
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS address_labels (
-                address TEXT PRIMARY KEY,
-                label TEXT,
-                category TEXT,
-                known_entity BOOLEAN,
-                first_seen TIMESTAMP WITHOUT TIME ZONE,
-                last_seen TIMESTAMP WITHOUT TIME ZONE
-            )
-        """)
+@contextmanager
+def db_connection():
+    pool = get_db_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
 
-        conn.commit()
+
+# Creates the tables and brings them up to the latest schema version (see migrations/)
+def ensure_tables_exist():
+    conn = None
+    try:
+        conn = psycopg2.connect(**DB_PARAMS)
+        apply_migrations(conn)
         print("Database tables verified/created successfully")
     except Exception as e:
         print(f"Database error: {e}")
@@ -148,8 +210,10 @@ def ensure_tables_exist():
 
 
 def save_state(state_dict):
-    with open(STATE_FILE, 'w') as f:
+    tmp_file = f"{STATE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w') as f:
         json.dump(state_dict, f)
+    os.replace(tmp_file, STATE_FILE)
     print(f"State saved to {STATE_FILE}")
 
 
@@ -161,21 +225,120 @@ def load_state():
 
 
 def track_api_call():
-    global api_calls_made
-    api_calls_made += 1
+    global api_calls_made, process_api_calls
+    with api_calls_lock:
+        process_api_calls += 1
+        if shared_api_calls is not None:
+            with shared_api_calls.get_lock():
+                shared_api_calls.value += 1
+                api_calls_made = shared_api_calls.value
+        else:
+            api_calls_made += 1
+        calls = api_calls_made
 
-    if api_calls_made >= MAX_API_CALLS_PER_DAY:
-        print(f"WARNING: Maximum API calls reached ({api_calls_made}). Exiting.")
+    if calls >= MAX_API_CALLS_PER_DAY:
+        print(f"WARNING: Maximum API calls reached ({calls}). Exiting.")
         sys.exit(1)
-    elif api_calls_made >= MAX_API_CALLS_PER_DAY * 0.9:
-        print(f"WARNING: Approaching API call limit ({api_calls_made}/{MAX_API_CALLS_PER_DAY})")
+    elif calls >= MAX_API_CALLS_PER_DAY * 0.9:
+        print(f"WARNING: Approaching API call limit ({calls}/{MAX_API_CALLS_PER_DAY})")
+
+    # Prints status and saves the call count every 10 calls; block progress is kept per task in the task queue
+    if calls % 10 == 0:
+        print(f"API calls made: {calls}/{MAX_API_CALLS_PER_DAY}")
+        save_state({"api_calls_made": calls})
+
+
+def load_block_cache():
+    if os.path.exists(BLOCK_CACHE_FILE):
+        with open(BLOCK_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+        return {
+            "resolved": {int(ts): block for ts, block in cache.get("resolved", {}).items()},
+            "anchors": {int(block): ts for block, ts in cache.get("anchors", {}).items()}
+        }
+    return {"resolved": {}, "anchors": {}}
+
+
+def save_block_cache():
+    with block_cache_lock:
+        cache = {
+            "resolved": {str(ts): block for ts, block in block_cache["resolved"].items()},
+            "anchors": {str(block): ts for block, ts in block_cache["anchors"].items()}
+        }
+    tmp_file = f"{BLOCK_CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_file, BLOCK_CACHE_FILE)
+
+
+block_cache = load_block_cache()
+block_cache_lock = threading.Lock()
+
+
+# Every fetched transaction carries its exact (blockNumber, timeStamp) pair, keep the first and last of each page
+def record_block_anchors(txs):
+    if not txs:
+        return
 
-    # Prints status every 10 calls
-    if api_calls_made % 10 == 0:
-        print(f"API calls made: {api_calls_made}/{MAX_API_CALLS_PER_DAY}")
+    with block_cache_lock:
+        for tx in (txs[0], txs[-1]):
+            if tx.get('blockNumber') and tx.get('timeStamp'):
+                block_cache["anchors"][int(tx['blockNumber'])] = int(tx['timeStamp'])
+
+
+# Interpolates between the nearest known anchors around the timestamp.
+# Returns (block, exact); exact is only True when the anchors pin the answer down
+# (adjacent blocks, or a post-merge stretch with no missed slots).
+def estimate_block(timestamp):
+    with block_cache_lock:
+        anchors = sorted(block_cache["anchors"].items())
+
+    if len(anchors) < 2:
+        return None, False
+
+    timestamps = [ts for _, ts in anchors]
+    i = bisect.bisect_right(timestamps, timestamp)
+    if i == 0 or i == len(anchors):
+        return None, False
+
+    lo_block, lo_ts = anchors[i - 1]
+    hi_block, hi_ts = anchors[i]
+
+    if hi_block == lo_block + 1:
+        return lo_block, True
+
+    if lo_block >= MERGE_BLOCK and (hi_ts - lo_ts) == (hi_block - lo_block) * SLOT_SECONDS:
+        return lo_block + (timestamp - lo_ts) // SLOT_SECONDS, True
+
+    estimate = lo_block + int((timestamp - lo_ts) * (hi_block - lo_block) / max(hi_ts - lo_ts, 1))
+    return estimate, False
 
 
 def timestamp_to_block(timestamp):
+    timestamp = int(timestamp)
+
+    with block_cache_lock:
+        cached = block_cache["resolved"].get(timestamp)
+    if cached is not None:
+        return cached
+
+    estimate, exact = estimate_block(timestamp)
+    if exact:
+        block = estimate
+    else:
+        block = fetch_block_by_timestamp(timestamp)
+        if block is None:
+            if estimate is not None:
+                print(f"Using interpolated block {estimate} for timestamp {timestamp}")
+            return estimate
+
+    with block_cache_lock:
+        block_cache["resolved"][timestamp] = block
+    save_block_cache()
+    return block
+
+
+def fetch_block_by_timestamp(timestamp):
     params = {
         "module": "block",
         "action": "getblocknobytime",
@@ -185,8 +348,7 @@ def timestamp_to_block(timestamp):
     }
 
     try:
-        track_api_call()
-        response = requests.get(BASE_URL, params=params, timeout=10)
+        response = api_get(params, timeout=10)
         data = response.json()
 
         if response.status_code == 200 and data.get("status") == "1":
@@ -199,15 +361,18 @@ def timestamp_to_block(timestamp):
         return None
 
 
-def get_transactions_by_time_period(address, period, action="txlist"):
+def get_period_blocks(period):
     start_date = datetime.datetime.fromisoformat(period["start_date"])
     end_date = datetime.datetime.fromisoformat(period["end_date"])
 
     start_timestamp = int(start_date.timestamp())
     end_timestamp = int(end_date.timestamp())
 
-    start_block = timestamp_to_block(start_timestamp)
-    end_block = timestamp_to_block(end_timestamp)
+    return fetch_concurrently(timestamp_to_block, [start_timestamp, end_timestamp])
+
+
+def get_transactions_by_time_period(address, period, action="txlist"):
+    start_block, end_block = get_period_blocks(period)
 
     if not start_block or not end_block:
         print(f"Could not determine block numbers for period {period['name']}")
@@ -217,100 +382,74 @@ def get_transactions_by_time_period(address, period, action="txlist"):
     return get_transactions(address, start_block, end_block, action)
 
 
-def get_transactions(address, start_block, end_block, action="txlist"):
-    all_txs = []
-    block_step = 10000
-    current_block = start_block
-
-    while current_block <= end_block:
-        next_block = min(current_block + block_step - 1, end_block)
-        params = {
-            "module": "account",
-            "action": action,
-            "address": address,
-            "startblock": current_block,
-            "endblock": next_block,
-            "sort": "asc",
-            "apikey": API_KEY
-        }
+# Content-addressed response store: one gzipped JSON file per request, named by the
+# hash of its parameters (module, action, address/txhash, block range) without the API key
+def response_store_path(params):
+    key_params = {k: v for k, v in params.items() if k != "apikey"}
+    key = hashlib.sha256(json.dumps(key_params, sort_keys=True, default=str).encode()).hexdigest()
+    return os.path.join(RESPONSE_STORE_DIR, params["module"], params["action"], key[:2], f"{key}.json.gz")
 
-        max_retries = 3
-        success = False
 
-        for retry in range(max_retries):
-            try:
-                track_api_call()
-                response = requests.get(BASE_URL, params=params, timeout=20)
-                data = response.json()
-
-                print(f"Querying blocks {current_block:,} to {next_block:,}")
-
-                if response.status_code == 200 and data.get("status") == "1":
-                    txs = data["result"]
-                    if txs:
-                        all_txs.extend(txs)
-                        print(f"Found {len(txs)} transactions")
-                        save_state({
-                            "address": address,
-                            "last_processed_block": next_block + 1,
-                            "action": action,
-                            "api_calls_made": api_calls_made,
-                            "txs_found": len(all_txs)
-                        })
-                    success = True
-                    break
-                elif response.status_code == 200 and data.get("status") == "0":
-                    if "rate limit" in data.get("message", "").lower():
-                        print(f"Rate limit exceeded. Waiting for 5 seconds...")
-                        time.sleep(5)
-                        continue
-                    else:
-                        print(f"API returned message: {data.get('message')}")
-                        success = True
-                        break
-                else:
-                    print(f"Error: {response.status_code}, {data.get('message', 'Unknown error')}")
-                    time.sleep(1 * (retry + 1))
-            except Exception as e:
-                print(f"Exception during API call: {e}")
-                time.sleep(2 * (retry + 1))
+def load_stored_response(params, finalized_only=True):
+    path = response_store_path(params)
+    if not os.path.exists(path):
+        return None
 
-        if not success:
-            print(f"Failed after {max_retries} retries for blocks {current_block} to {next_block}")
+    try:
+        with gzip.open(path, 'rt') as f:
+            entry = json.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable stored response {path}: {e}")
+        return None
 
-        current_block = next_block + 1
-        time.sleep(RATE_LIMIT_DELAY)
+    if finalized_only and not entry.get("finalized"):
+        return None
+    return entry["result"]
 
-    return all_txs
 
+def store_response(params, result, finalized):
+    path = response_store_path(params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
-def get_internal_transactions(txhash):
-    params = {
-        "module": "account",
-        "action": "txlistinternal",
-        "txhash": txhash,
-        "apikey": API_KEY
+    entry = {
+        "params": {k: v for k, v in params.items() if k != "apikey"},
+        "result": result,
+        "finalized": finalized,
+        "fetched_at": int(time.time())
     }
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp_path, 'wt') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
 
-    try:
-        track_api_call()
-        response = requests.get(BASE_URL, params=params, timeout=10)
-        data = response.json()
 
-        if response.status_code == 200 and data.get("status") == "1":
-            return data["result"]
-        else:
-            print(f"Error getting internal transactions: {data.get('message')}")
-            return []
-    except Exception as e:
-        print(f"Error in get_internal_transactions: {e}")
-        return []
+latest_block = None
+latest_block_lock = threading.Lock()
 
 
-def get_token_transfers(address, start_block, end_block):
-    params = {
+# Chain head, fetched at most once per run and only when a new response has to be stored
+def get_latest_block():
+    global latest_block
+    with latest_block_lock:
+        if latest_block is None:
+            try:
+                response = api_get({"module": "proxy", "action": "eth_blockNumber", "apikey": API_KEY}, timeout=10)
+                latest_block = int(response.json()["result"], 16)
+            except Exception as e:
+                print(f"Error getting latest block: {e}")
+                return None
+        return latest_block
+
+
+def is_finalized(end_block):
+    head = get_latest_block()
+    return head is not None and end_block <= head - FINALITY_BLOCKS
+
+
+def account_params(address, start_block, end_block, action):
+    return {
         "module": "account",
-        "action": "tokentx",
+        "action": action,
         "address": address,
         "startblock": start_block,
         "endblock": end_block,
@@ -318,64 +457,490 @@ def get_token_transfers(address, start_block, end_block):
         "apikey": API_KEY
     }
 
+
+# Raised when a window could not be fetched: it is not recorded and its task goes back to pending
+class BlockWindowError(Exception):
+    pass
+
+
+# Returns the window's transactions and whether its range was final when they were fetched
+def get_block_window(address, start_block, end_block, action="txlist"):
+    params = account_params(address, start_block, end_block, action)
+
+    stored = load_stored_response(params)
+    if stored is not None:
+        return stored, True
+
+    max_retries = 3
+
+    for retry in range(max_retries):
+        try:
+            response = api_get(params)
+            data = response.json()
+
+            print(f"Querying blocks {start_block:,} to {end_block:,}")
+
+            if response.status_code == 200 and data.get("status") == "1":
+                txs = data["result"]
+                if txs:
+                    print(f"Found {len(txs)} transactions")
+                record_block_anchors(txs)
+                finalized = is_finalized(end_block)
+                store_response(params, txs, finalized)
+                return txs, finalized
+            elif response.status_code == 200 and data.get("status") == "0":
+                if "No transactions found" in data.get("message", ""):
+                    finalized = is_finalized(end_block)
+                    store_response(params, [], finalized)
+                    return [], finalized
+                if "rate limit" in f"{data.get('message', '')} {data.get('result', '')}".lower():
+                    print(f"Rate limit exceeded. Waiting for 5 seconds...")
+                    time.sleep(5)
+                    continue
+                print(f"API returned message: {data.get('message')}, {data.get('result')}")
+                time.sleep(1 * (retry + 1))
+            else:
+                print(f"Error: {response.status_code}, {data.get('message', 'Unknown error')}")
+                time.sleep(1 * (retry + 1))
+        except Exception as e:
+            print(f"Exception during API call: {e}")
+            time.sleep(2 * (retry + 1))
+
+    raise BlockWindowError(f"{action} for {address} blocks {start_block} to {end_block} failed after {max_retries} retries")
+
+
+# Walks [start_block, end_block] in adaptive windows: a window that hits RESULT_CAP is
+# halved and retried, sparse windows double the next window and dense ones halve it
+# on_window(window_start, window_end, txs, finalized) is called for every accepted window; with
+# collect=False the pages are only handed to on_window and not kept in memory
+def walk_block_range(address, start_block, end_block, action, on_window=None, collect=True):
+    results = []
+    window = INITIAL_BLOCK_WINDOW
+    current_block = start_block
+
+    while current_block <= end_block:
+        window_end = min(current_block + window - 1, end_block)
+        txs, finalized = get_block_window(address, current_block, window_end, action)
+
+        if len(txs) >= RESULT_CAP:
+            if window_end > current_block:
+                window = max((window_end - current_block + 1) // 2, 1)
+                print(f"Result cap hit for blocks {current_block:,} to {window_end:,}, splitting window to {window:,} blocks")
+                continue
+            print(f"WARNING: block {current_block:,} alone has {len(txs)} {action} results, some may be missing")
+
+        if collect:
+            results.extend(txs)
+        if on_window:
+            on_window(current_block, window_end, txs, finalized)
+
+        if len(txs) < RESULT_CAP * SPARSE_FRACTION:
+            window = min(window * 2, MAX_BLOCK_WINDOW)
+        elif len(txs) > RESULT_CAP * DENSE_FRACTION:
+            window = max(window // 2, 1)
+
+        current_block = window_end + 1
+
+    return results
+
+
+# Persistent task queue: one task per (address, action, block segment). Each task keeps a
+# next_block cursor and the list of windows it has finished, so an interrupted run resumes at
+# the exact window and the finished windows are read back from the response store. Windows record
+# whether they were final when fetched; a done task with windows that were not is walked again from
+# the first of them on the next run (requeue_unfinalized_tasks).
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def task_db():
+    conn = sqlite3.connect(TASK_DB_FILE, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def ensure_task_queue():
+    conn = task_db()
     try:
-        track_api_call()
-        response = requests.get(BASE_URL, params=params, timeout=20)
-        data = response.json()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                address TEXT,
+                action TEXT,
+                start_block INTEGER,
+                end_block INTEGER,
+                next_block INTEGER,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                attempts INTEGER DEFAULT 0,
+                updated_at REAL,
+                UNIQUE (address, action, start_block, end_block)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_windows (
+                task_id INTEGER,
+                start_block INTEGER,
+                end_block INTEGER,
+                rows INTEGER,
+                finalized INTEGER DEFAULT 0,
+                PRIMARY KEY (task_id, start_block)
+            )
+        """)
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(task_windows)")]
+        if "finalized" not in columns:
+            # Windows recorded before finality was tracked are checked again once
+            conn.execute("ALTER TABLE task_windows ADD COLUMN finalized INTEGER DEFAULT 0")
+    finally:
+        conn.close()
 
-        if response.status_code == 200 and data.get("status") == "1":
-            return data["result"]
-        elif response.status_code == 200 and data.get("status") == "0":
-            if "No transactions found" in data.get("message", ""):
-                print(f"No token transfers found for {address}")
+
+def enqueue_tasks(address, action, segments):
+    conn = task_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        task_ids = []
+        for segment_start, segment_end in segments:
+            conn.execute("""
+                INSERT OR IGNORE INTO tasks (address, action, start_block, end_block, next_block, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (address, action, segment_start, segment_end, segment_start, time.time()))
+            row = conn.execute("""
+                SELECT id FROM tasks WHERE address = ? AND action = ? AND start_block = ? AND end_block = ?
+            """, (address, action, segment_start, segment_end)).fetchone()
+            task_ids.append(row["id"])
+        conn.execute("COMMIT")
+        return task_ids
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+# Atomically moves a pending task to running for this worker; task_id=None claims the oldest pending task
+def claim_task(task_id=None):
+    conn = task_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if task_id is None:
+            row = conn.execute("SELECT * FROM tasks WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+        else:
+            row = conn.execute("SELECT * FROM tasks WHERE id = ? AND status = 'pending'", (task_id,)).fetchone()
+        if row:
+            conn.execute("""
+                UPDATE tasks SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            """, (WORKER_ID, time.time(), row["id"]))
+        conn.execute("COMMIT")
+        return dict(row) if row else None
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def set_task_status(task_id, status):
+    conn = task_db()
+    try:
+        conn.execute("UPDATE tasks SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), task_id))
+    finally:
+        conn.close()
+
+
+def get_task(task_id):
+    conn = task_db()
+    try:
+        row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def record_task_window(task_id, window_start, window_end, rows, finalized):
+    conn = task_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("""
+            INSERT OR REPLACE INTO task_windows (task_id, start_block, end_block, rows, finalized)
+            VALUES (?, ?, ?, ?, ?)
+        """, (task_id, window_start, window_end, rows, int(finalized)))
+        conn.execute("UPDATE tasks SET next_block = ?, updated_at = ? WHERE id = ?",
+                     (window_end + 1, time.time(), task_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def worker_is_alive(worker):
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+# Hands tasks left 'running' by crashed workers (dead pid on this host, or no heartbeat) back to the queue
+def requeue_stale_tasks():
+    conn = task_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("SELECT id, worker, updated_at FROM tasks WHERE status = 'running'").fetchall()
+        requeued = 0
+        for row in rows:
+            alive = worker_is_alive(row["worker"])
+            if alive is False or (alive is None and row["updated_at"] < time.time() - TASK_LEASE_SECONDS):
+                conn.execute("UPDATE tasks SET status = 'pending', worker = NULL WHERE id = ?", (row["id"],))
+                requeued += 1
+        conn.execute("COMMIT")
+        if requeued:
+            print(f"Requeued {requeued} interrupted tasks")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+# Hands done tasks back to the queue from their first window that reached past the finalized head
+# when it was fetched, so transactions that landed in those blocks since are picked up. Called once
+# at the start of a run; the windows before it are still read back from the store.
+def requeue_unfinalized_tasks():
+    conn = task_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT task_id, MIN(task_windows.start_block) AS start_block
+            FROM task_windows JOIN tasks ON tasks.id = task_windows.task_id
+            WHERE tasks.status = 'done' AND NOT task_windows.finalized
+            GROUP BY task_id
+        """).fetchall()
+        for row in rows:
+            conn.execute("DELETE FROM task_windows WHERE task_id = ? AND start_block >= ?",
+                         (row["task_id"], row["start_block"]))
+            conn.execute("UPDATE tasks SET status = 'pending', worker = NULL, next_block = ?, updated_at = ? WHERE id = ?",
+                         (row["start_block"], time.time(), row["task_id"]))
+        conn.execute("COMMIT")
+        if rows:
+            print(f"Requeued {len(rows)} tasks with blocks that were not final yet")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def clear_task_queue():
+    conn = task_db()
+    try:
+        conn.execute("DELETE FROM task_windows")
+        conn.execute("DELETE FROM tasks")
+    finally:
+        conn.close()
+
+
+def run_task(task, sink=None):
+    print(f"Task {task['id']}: {task['action']} for {task['address']} blocks {task['next_block']:,} to {task['end_block']:,}")
+
+    def on_window(window_start, window_end, txs, finalized):
+        if sink:
+            sink(txs)
+        record_task_window(task["id"], window_start, window_end, len(txs), finalized)
+
+    try:
+        results = walk_block_range(
+            task["address"], task["next_block"], task["end_block"], task["action"],
+            on_window=on_window, collect=sink is None
+        )
+    except BaseException:
+        # Failed windows, budget exits and crashes leave the cursor where it is and release the task for a resume
+        set_task_status(task["id"], "pending")
+        raise
+    set_task_status(task["id"], "done")
+    return results
+
+
+# Pages of a task's finished windows, read back one at a time from the response store
+def iter_task_windows(task_id):
+    task = get_task(task_id)
+    conn = task_db()
+    try:
+        windows = conn.execute(
+            "SELECT start_block, end_block FROM task_windows WHERE task_id = ? ORDER BY start_block", (task_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    for window in windows:
+        params = account_params(task["address"], window["start_block"], window["end_block"], task["action"])
+        stored = load_stored_response(params, finalized_only=False)
+        if stored:
+            yield stored
+
+
+def load_task_results(task_id):
+    return [tx for page in iter_task_windows(task_id) for tx in page]
+
+
+# Runs (or waits for) one task. Without a sink the task's results are returned as a list,
+# with a sink every page is passed to it instead and nothing is kept.
+def wait_for_task(task_id, sink=None):
+    while True:
+        task = claim_task(task_id)
+        if task:
+            # A resumed task only walks from its cursor, earlier windows come from the store
+            if sink:
+                for page in iter_task_windows(task_id):
+                    sink(page)
+                run_task(task, sink)
                 return []
-            else:
-                print(f"API returned message: {data.get('message')}")
+            previous = load_task_results(task_id)
+            return previous + run_task(task)
+
+        if get_task(task_id)["status"] == "done":
+            if sink:
+                for page in iter_task_windows(task_id):
+                    sink(page)
                 return []
-        else:
-            print(f"Error: {response.status_code}, {data.get('message', 'Unknown error')}")
-            return []
-    except Exception as e:
-        print(f"Error in get_token_transfers: {e}")
+            return load_task_results(task_id)
+
+        # Another worker holds it, wait for it to finish or to be released
+        time.sleep(1)
+        requeue_stale_tasks()
+
+
+# Drains every pending task in the queue; several processes can run this side by side (python web.py --worker)
+def drain_task_queue():
+    ensure_task_queue()
+    requeue_stale_tasks()
+    requeue_unfinalized_tasks()
+    drained = 0
+    while True:
+        task = claim_task()
+        if not task:
+            break
+        try:
+            run_task(task)
+        except BlockWindowError as e:
+            # The task is pending again; stop here instead of claiming it straight back
+            print(f"Task {task['id']} failed, left for the next run: {e}")
+            break
+        drained += 1
+    print(f"Worker {WORKER_ID} finished {drained} tasks")
+
+
+# Shared paginator for every account endpoint (txlist, tokentx, txlistinternal).
+# The range is cut into up to MAX_CONCURRENT_REQUESTS segments, queued as tasks and walked concurrently.
+# Segments finished by an earlier or parallel run are read back instead of re-fetched.
+# With a sink, pages are streamed to it as they arrive (in no particular order) and nothing is returned.
+def paginate_blocks(address, start_block, end_block, action, sink=None):
+    total_blocks = end_block - start_block + 1
+    if total_blocks <= 0:
         return []
+    segment_count = max(1, min(MAX_CONCURRENT_REQUESTS, -(-total_blocks // INITIAL_BLOCK_WINDOW)))
+    segment_size = -(-total_blocks // segment_count)
 
+    segments = [
+        (segment_start, min(segment_start + segment_size - 1, end_block))
+        for segment_start in range(start_block, end_block + 1, segment_size)
+    ]
+    task_ids = enqueue_tasks(address, action, segments)
 
-def get_internal_transactions_by_address(address, start_block, end_block):
+    if sink:
+        fetch_concurrently(lambda task_id: wait_for_task(task_id, sink), task_ids)
+        return []
+
+    # Segments are fetched concurrently but collected in block order
+    results = fetch_concurrently(wait_for_task, task_ids)
+
+    return [tx for segment_txs in results for tx in segment_txs]
+
+
+def get_transactions(address, start_block, end_block, action="txlist"):
+    return paginate_blocks(address, start_block, end_block, action)
+
+
+# Internal transactions fetched by txhash carry neither the hash nor a traceId. Both are filled in,
+# the trace id from the call's position in the trace, so every call keeps its own row key and
+# get_traced_hashes finds the transaction on the next run.
+def with_trace_keys(txhash, internal_txs):
+    for i, tx in enumerate(internal_txs):
+        if not tx.get('hash'):
+            tx['hash'] = txhash
+        if not tx.get('traceId'):
+            tx['traceId'] = str(i)
+    return internal_txs
+
+
+# The records of a stored response entry, with trace keys filled in for per-transaction traces
+def stored_result(entry):
+    txhash = entry.get("params", {}).get("txhash")
+    return with_trace_keys(txhash, entry["result"]) if txhash else entry["result"]
+
+
+def get_internal_transactions(txhash):
     params = {
         "module": "account",
         "action": "txlistinternal",
-        "address": address,
-        "startblock": start_block,
-        "endblock": end_block,
-        "sort": "asc",
+        "txhash": txhash,
         "apikey": API_KEY
     }
 
+    stored = load_stored_response(params)
+    if stored is not None:
+        return with_trace_keys(txhash, stored)
+
     try:
-        track_api_call()
-        response = requests.get(BASE_URL, params=params, timeout=20)
+        response = api_get(params, timeout=10)
         data = response.json()
 
         if response.status_code == 200 and data.get("status") == "1":
-            return data["result"]
-        elif response.status_code == 200 and data.get("status") == "0":
-            if "No transactions found" in data.get("message", ""):
-                print(f"No internal transactions found for {address}")
-                return []
-            else:
-                print(f"API returned message: {data.get('message')}")
-                return []
+            # Traces of a mined transaction never change
+            store_response(params, data["result"], True)
+            return with_trace_keys(txhash, data["result"])
+        elif response.status_code == 200 and "No transactions found" in data.get("message", ""):
+            store_response(params, [], True)
+            return []
         else:
-            print(f"Error: {response.status_code}, {data.get('message', 'Unknown error')}")
+            print(f"Error getting internal transactions: {data.get('message')}")
             return []
     except Exception as e:
-        print(f"Error in get_internal_transactions_by_address: {e}")
+        print(f"Error in get_internal_transactions: {e}")
         return []
 
 
+def get_token_transfers(address, start_block, end_block):
+    transfers = paginate_blocks(address, start_block, end_block, "tokentx")
+
+    if not transfers:
+        print(f"No token transfers found for {address}")
+    return transfers
+
+
+def get_internal_transactions_by_address(address, start_block, end_block):
+    internal_txs = paginate_blocks(address, start_block, end_block, "txlistinternal")
+
+    if not internal_txs:
+        print(f"No internal transactions found for {address}")
+    return internal_txs
+
+
 def get_wallet_addresses_from_transactions(transactions, limit=10):
     addresses = {}
+    update_wallet_candidates(addresses, transactions)
+    return top_wallet_candidates(addresses, limit)
+
 
+def update_wallet_candidates(addresses, transactions):
     for tx in transactions:
         sender = tx.get('from', '').lower()
         receiver = tx.get('to', '').lower()
@@ -389,305 +954,542 @@ def get_wallet_addresses_from_transactions(transactions, limit=10):
         if receiver and receiver not in addresses:
             addresses[receiver] = addresses.get(receiver, 0) + 1
 
+
+def top_wallet_candidates(addresses, limit=10):
     sorted_addresses = sorted(addresses.items(), key=lambda x: x[1], reverse=True)
     return [addr for addr, count in sorted_addresses[:limit]]
 
 
-def analyze_and_extract_suspicious(transactions):
-    suspicious = []
+def load_suspicious_rules():
+    rules = dict(SUSPICIOUS_RULES)
+    if os.path.exists(RULES_FILE):
+        with open(RULES_FILE, 'r') as f:
+            rules.update(json.load(f))
+    return rules
 
-    for tx in transactions:
-        value_eth = float(tx.get('value', '0')) / 1e18
 
-        if value_eth > 50:
-            tx['flag_reason'] = "High value transaction"
-            suspicious.append(tx)
-            continue
+# Evaluates every rule over the whole batch at once. Returns one boolean column per
+# flag reason (in rule priority order), one row per transaction.
+def classify_transactions(transactions, rules=None):
+    rules = rules or load_suspicious_rules()
+    df = pd.DataFrame(transactions, columns=["value", "isError", "gasUsed", "to", "input"])
 
-        if tx.get('isError') == '1':
-            tx['flag_reason'] = "Failed transaction"
-            suspicious.append(tx)
-            continue
+    value_eth = pd.to_numeric(df["value"], errors="coerce").fillna(0).to_numpy() / 1e18
+    gas_used = pd.to_numeric(df["gasUsed"], errors="coerce").fillna(0).to_numpy()
+    input_data = df["input"].fillna("").astype(str).str.lower()
+    selectors = input_data.str[:10]
 
-        if int(tx.get('gasUsed', 0)) > 1000000:
-            tx['flag_reason'] = "High gas consumption"
-            suspicious.append(tx)
-            continue
+    flags = {
+        "High value transaction": value_eth > rules["high_value_eth"],
+        "Failed transaction": (df["isError"] == "1").to_numpy(),
+        "High gas consumption": gas_used > rules["high_gas_used"],
+        "Contract creation": (df["to"].fillna("") == "").to_numpy()
+    }
 
-        if tx.get('to') == '' or tx.get('to') is None:
-            tx['flag_reason'] = "Contract creation"
-            suspicious.append(tx)
-            continue
+    methods = rules["suspicious_methods"]
+    if methods:
+        pattern = "|".join(re.escape(method.lower()) for method in methods)
+        flags["Suspicious method call"] = input_data.str.contains(pattern, regex=True).to_numpy()
 
-        input_data = tx.get('input', '').lower()
-        suspicious_methods = ['flashloan', 'flash', 'swap', 'arbitrage']
+    for method, signature in rules["method_selectors"].items():
+        flags[f"Token {method} operation"] = (selectors == signature.lower()).to_numpy()
 
-        if any(method in input_data for method in suspicious_methods):
-            tx['flag_reason'] = "Suspicious method call"
-            suspicious.append(tx)
-            continue
+    return pd.DataFrame(flags)
 
-        input_data = tx.get('input', '').lower()
-        for method, signature in TOKEN_SIGNATURES.items():
-            if input_data.startswith(signature):
-                tx['flag_reason'] = f"Token {method} operation"
-                suspicious.append(tx)
-                break
+
+def analyze_and_extract_suspicious(transactions):
+    if not transactions:
+        print("Extracted 0 suspicious transactions from 0 total")
+        return []
+
+    flags = classify_transactions(transactions)
+    matched = flags.to_numpy()
+    reasons = flags.columns.to_numpy()
+
+    # Each distinct combination of matched rules is turned into its reason list only once
+    codes = matched.astype(np.int64) @ (1 << np.arange(matched.shape[1], dtype=np.int64))
+    reasons_by_code = {
+        code: reasons[(code >> np.arange(len(reasons))) & 1 == 1].tolist()
+        for code in np.unique(codes[codes > 0]).tolist()
+    }
+
+    suspicious = []
+    for i, code in zip(np.flatnonzero(codes).tolist(), codes[codes > 0].tolist()):
+        tx = transactions[i]
+        tx_reasons = reasons_by_code[code]
+        # flag_reason keeps the highest-priority match, flag_reasons lists every rule that matched
+        tx['flag_reason'] = tx_reasons[0]
+        tx['flag_reasons'] = list(tx_reasons)
+        suspicious.append(tx)
 
     print(f"Extracted {len(suspicious)} suspicious transactions from {len(transactions)} total")
     return suspicious
 
 
-def insert_transactions(transactions, table_name="internal_transactions"):
-    if not transactions:
-        print("No transactions to insert")
-        return
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    text = str(value)
+    return (text.replace("\\", "\\\\").replace("\t", "\\t")
+                .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def copy_batch(cursor, staging_table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {staging_table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+# Streams rows into a session-local staging table with COPY, then merges them
+# into the target table with one INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+# on_inserted is an optional statement run in the same transaction over the
+# newly inserted rows, which it sees as the CTE "inserted". With returning, those
+# columns of the newly inserted rows are passed to on_returned after the commit.
+def bulk_load(table_name, columns, conflict_columns, rows, on_inserted=None, returning=None, on_returned=None):
+    staging_table = f"staging_{table_name}"
+    column_list = ", ".join(columns)
+    started = time.perf_counter()
+    staged = 0
+    inserted = 0
+    returned = None
 
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    CREATE TEMP TABLE IF NOT EXISTS {staging_table}
+                    (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+                """)
+
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= COPY_BATCH_SIZE:
+                        copy_batch(cursor, staging_table, columns, batch)
+                        staged += len(batch)
+                        batch = []
+                if batch:
+                    copy_batch(cursor, staging_table, columns, batch)
+                    staged += len(batch)
+
+                merge = f"""
+                    INSERT INTO {table_name} ({column_list})
+                    SELECT {column_list} FROM {staging_table}
+                    ON CONFLICT ({', '.join(conflict_columns)}) DO NOTHING
+                """
+                if on_inserted:
+                    cursor.execute(f"""
+                        WITH inserted AS ({merge} RETURNING *),
+                        applied AS ({on_inserted})
+                        SELECT {', '.join(returning) if returning else 'COUNT(*)'} FROM inserted
+                    """)
+                    if returning:
+                        returned = cursor.fetchall()
+                        inserted = len(returned)
+                    else:
+                        inserted = cursor.fetchone()[0]
+                elif returning:
+                    cursor.execute(f"{merge} RETURNING {', '.join(returning)}")
+                    returned = cursor.fetchall()
+                    inserted = len(returned)
+                else:
+                    cursor.execute(merge)
+                    inserted = cursor.rowcount
+            conn.commit()
+    except Exception as e:
+        print(f"Database error loading {table_name}: {e}")
+        return 0
+
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {staged} rows into {table_name} ({inserted} new) in {elapsed:.2f}s "
+          f"({staged / max(elapsed, 1e-6):,.0f} rows/s)")
+    if on_returned and returned is not None:
+        on_returned(returned)
+    return inserted
+
+
+# Converts API records to rows, skipping (and reporting) any record that fails conversion
+def convert_rows(records, to_row, kind):
+    for record in records:
+        try:
+            yield to_row(record)
+        except Exception as e:
+            print(f"Error converting {kind} {record.get('hash', 'unknown')}: {e}")
+
+
+# Addresses and hashes are stored as raw bytes (see migrations/004_compact_storage.sql)
+def hex_to_bytes(value):
+    value = (value or '').lower()
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value)
+
+
+def bytes_to_hex(value):
+    value = bytes(value)
+    return '0x' + value.hex() if value else ''
+
+
+def transaction_row(tx):
+    return (
+        hex_to_bytes(tx.get('hash', '')),
+        int(tx.get('blockNumber', 0)),
+        datetime.datetime.fromtimestamp(int(tx.get('timeStamp', 0))),
+        hex_to_bytes(tx.get('from', '')),
+        hex_to_bytes(tx.get('to', '')),
+        int(tx.get('value', '0') or 0),
+        int(tx.get('gas', 0)),
+        int(tx.get('gasUsed', 0)),
+        tx.get('flag_reason', '') or tx.get('type', ''),
+        tx.get('isError', '0') == '1'
+    )
+
+
+def token_transfer_row(transfer):
+    return (
+        hex_to_bytes(transfer.get('hash', '')),
+        int(transfer.get('blockNumber', 0)),
+        datetime.datetime.fromtimestamp(int(transfer.get('timeStamp', 0))),
+        hex_to_bytes(transfer.get('contractAddress', '')),
+        hex_to_bytes(transfer.get('from', '')),
+        hex_to_bytes(transfer.get('to', '')),
+        int(transfer.get('value', '0') or 0),
+        transfer.get('tokenName', ''),
+        transfer.get('tokenSymbol', ''),
+        int(transfer.get('tokenDecimal', 18))
+    )
+
+
+def internal_transaction_row(tx):
+    return (
+        hex_to_bytes(tx.get('hash', '')),
+        int(tx.get('blockNumber', 0)),
+        datetime.datetime.fromtimestamp(int(tx.get('timeStamp', 0))),
+        hex_to_bytes(tx.get('from', '')),
+        hex_to_bytes(tx.get('to', '')),
+        int(tx.get('value', '0') or 0),
+        tx.get('traceId', ''),
+        tx.get('isError', ''),
+        tx.get('type', '')
+    )
+
+
+# Folds newly inserted transactions into wallet_aggregates (see migrations/003_wallet_aggregates.sql),
+# so sql/02 and sql/06 read finished aggregates instead of re-grouping internal_transactions.
+# Only rows that were actually new are counted, whatever order blocks arrive in.
+WALLET_AGGREGATES_SQL = """
+    INSERT INTO wallet_aggregates (
+        wallet_address, sent_count, total_sent_wei, failed_sent, max_sent_wei,
+        failed_count, high_value_count, gas_flag_count, last_block
+    )
+    SELECT
+        sender,
+        COUNT(*),
+        COALESCE(SUM(value_wei), 0),
+        SUM(CASE WHEN is_error THEN 1 ELSE 0 END),
+        MAX(value_wei),
+        COUNT(*) FILTER (WHERE tx_type = 'Failed transaction'),
+        COUNT(*) FILTER (WHERE tx_type = 'High value transaction'),
+        COUNT(*) FILTER (WHERE tx_type = 'High gas consumption'),
+        MAX(block_number)
+    FROM inserted
+    WHERE sender IS NOT NULL
+    GROUP BY sender
+    ORDER BY sender
+    ON CONFLICT (wallet_address) DO UPDATE SET
+        sent_count = wallet_aggregates.sent_count + EXCLUDED.sent_count,
+        total_sent_wei = wallet_aggregates.total_sent_wei + EXCLUDED.total_sent_wei,
+        failed_sent = wallet_aggregates.failed_sent + EXCLUDED.failed_sent,
+        max_sent_wei = GREATEST(wallet_aggregates.max_sent_wei, EXCLUDED.max_sent_wei),
+        failed_count = wallet_aggregates.failed_count + EXCLUDED.failed_count,
+        high_value_count = wallet_aggregates.high_value_count + EXCLUDED.high_value_count,
+        gas_flag_count = wallet_aggregates.gas_flag_count + EXCLUDED.gas_flag_count,
+        last_block = GREATEST(wallet_aggregates.last_block, EXCLUDED.last_block),
+        ingest_xid = pg_current_xact_id()
+"""
+
+
+# on_new receives the transactions that were not in the table yet, once they are committed
+def insert_transactions(transactions, table_name="internal_transactions", on_new=None):
+    if not transactions:
+        print("No transactions to insert")
+        return 0
 
-        inserted = 0
+    def on_returned(rows):
+        new_keys = {(bytes(tx_hash), block_number) for tx_hash, block_number in rows}
+        new_txs = []
         for tx in transactions:
             try:
-                flag_reason = tx.get('flag_reason', '')
-
-                cursor.execute(f"""
-                    INSERT INTO {table_name} (
-                        tx_hash, block_number, timestamp,
-                        sender, receiver, value_eth,
-                        gas, gas_used, tx_type, is_error
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (tx_hash) DO NOTHING;
-                """, (
-                    tx.get('hash', ''),
-                    int(tx.get('blockNumber', 0)),
-                    datetime.datetime.fromtimestamp(int(tx.get('timeStamp', 0))),
-                    tx.get('from', ''),
-                    tx.get('to', ''),
-                    float(tx.get('value', '0')) / 1e18,
-                    int(tx.get('gas', 0)),
-                    int(tx.get('gasUsed', 0)),
-                    flag_reason or tx.get('type', ''),
-                    tx.get('isError', '0') == '1'
-                ))
-                inserted += 1
-
-                if inserted % 100 == 0:
-                    conn.commit()
-                    print(f"Committed {inserted} transactions so far")
-            except Exception as e:
-                print(f"Error inserting tx {tx.get('hash', 'unknown')}: {e}")
-
-        conn.commit()
-        print(f"Successfully inserted {inserted} transactions into {table_name}")
-    except Exception as e:
-        print(f"Database error: {e}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
+                key = (hex_to_bytes(tx.get('hash', '')), int(tx.get('blockNumber', 0)))
+            except ValueError:
+                continue
+            if key in new_keys:
+                new_txs.append(tx)
+        on_new(new_txs)
+
+    return bulk_load(
+        table_name,
+        ["tx_hash", "block_number", "timestamp", "sender", "receiver", "value_wei",
+         "gas", "gas_used", "tx_type", "is_error"],
+        ["tx_hash", "block_number"],
+        convert_rows(transactions, transaction_row, "tx"),
+        on_inserted=WALLET_AGGREGATES_SQL if table_name == "internal_transactions" else None,
+        returning=["tx_hash", "block_number"] if on_new else None,
+        on_returned=on_returned if on_new else None
+    )
+
+
+# Adds each flushed wallet's increments; RETURNING gives the stored totals the alerts are checked on
+LIVE_RISK_SQL = """
+    INSERT INTO wallet_risk_live (
+        wallet_address, failed_count, high_value_count, high_gas_count, total_count, risk_score, updated_at
+    ) VALUES %s
+    ON CONFLICT (wallet_address) DO UPDATE SET
+        failed_count = wallet_risk_live.failed_count + EXCLUDED.failed_count,
+        high_value_count = wallet_risk_live.high_value_count + EXCLUDED.high_value_count,
+        high_gas_count = wallet_risk_live.high_gas_count + EXCLUDED.high_gas_count,
+        total_count = wallet_risk_live.total_count + EXCLUDED.total_count,
+        risk_score = wallet_risk_live.risk_score + EXCLUDED.risk_score,
+        updated_at = EXCLUDED.updated_at
+    RETURNING wallet_address, risk_score
+"""
+
+
+# Online risk scoring: per-wallet counters (failed, high-value, high-gas, total) in one numpy array
+# with a row per wallet, keyed by an address index. Every newly loaded transaction is counted by its
+# flag_reason, the tx_type that wallet_aggregates and etl.py's risk_score count, so both scores agree
+# on the same transactions. The increments since the last flush go to
+# wallet_risk_live every RISK_FLUSH_SECONDS, and wallets whose stored score reaches
+# RISK_ALERT_THRESHOLD are reported, so a risky wallet shows up while it is being ingested.
+class LiveRiskScorer:
+    def __init__(self, capacity=4096):
+        self.index = {}
+        self.addresses = []
+        self.counts = np.zeros((capacity, len(RISK_WEIGHTS) + 1), dtype=np.int64)
+        self.flushed = np.zeros_like(self.counts)
+        self.weights = np.array(list(RISK_WEIGHTS.values()), dtype=np.int64)
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.alerts = 0
+
+    def wallet_ids(self, wallets):
+        ids = np.empty(len(wallets), dtype=np.int64)
+        for i, wallet in enumerate(wallets):
+            wallet_id = self.index.get(wallet)
+            if wallet_id is None:
+                wallet_id = self.index[wallet] = len(self.addresses)
+                self.addresses.append(wallet)
+            ids[i] = wallet_id
+        if len(self.addresses) > len(self.counts):
+            capacity = max(len(self.addresses), 2 * len(self.counts))
+            self.counts = self.grow(self.counts, capacity)
+            self.flushed = self.grow(self.flushed, capacity)
+        return ids
+
+    # New wallets start at zero; the existing rows are copied over
+    def grow(self, array, capacity):
+        grown = np.zeros((capacity, array.shape[1]), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def update(self, transactions):
+        txs = [tx for tx in transactions if tx.get('from')]
+        if txs:
+            # One column per weighted rule plus the total, one row per transaction
+            hits = np.array([
+                [tx.get('flag_reason') == reason for reason in RISK_WEIGHTS] + [True]
+                for tx in txs
+            ], dtype=np.int64)
+            with self.lock:
+                # Looked up first: new wallets can grow (and replace) self.counts
+                ids = self.wallet_ids([tx['from'].lower() for tx in txs])
+                np.add.at(self.counts, ids, hits)
+        self.flush()
+
+    def scores(self):
+        with self.lock:
+            return self.counts[:len(self.addresses), :len(RISK_WEIGHTS)] @ self.weights
+
+    def flush(self, force=False):
+        with self.lock:
+            if not force and time.monotonic() - self.last_flush < RISK_FLUSH_SECONDS:
+                return 0
+            self.last_flush = time.monotonic()
+            deltas = self.counts[:len(self.addresses)] - self.flushed[:len(self.addresses)]
+            changed = np.flatnonzero(deltas.any(axis=1))
+            deltas = deltas[changed]
+            self.flushed[changed] += deltas
+        if not changed.size:
+            return 0
+
+        score_deltas = deltas[:, :len(RISK_WEIGHTS)] @ self.weights
+        # Sorted like WALLET_AGGREGATES_SQL, so concurrent workers lock rows in the same order
+        rows = sorted(
+            (hex_to_bytes(self.addresses[wallet_id]), *delta.tolist(), int(score))
+            for wallet_id, delta, score in zip(changed.tolist(), deltas, score_deltas)
+        )
+        try:
+            with db_connection() as conn:
+                with conn.cursor() as cursor:
+                    stored = psycopg2.extras.execute_values(
+                        cursor, LIVE_RISK_SQL, rows,
+                        template="(%s, %s, %s, %s, %s, %s, LOCALTIMESTAMP)", page_size=len(rows), fetch=True
+                    )
+                conn.commit()
+        except Exception as e:
+            # The increments stay pending and go out with the next flush
+            print(f"Database error flushing live risk scores: {e}")
+            with self.lock:
+                self.flushed[changed] -= deltas
+            return 0
+
+        score_deltas = {row[0]: row[-1] for row in rows}
+        for address, risk_score in stored:
+            address = bytes(address)
+            previous = risk_score - score_deltas[address]
+            if previous < RISK_ALERT_THRESHOLD <= risk_score:
+                self.alert(address, previous, risk_score)
+        return len(rows)
+
+    def alert(self, address, previous, risk_score):
+        wallet = bytes_to_hex(address)
+        print(f"⚠️ Risk alert: {wallet} reached risk score {risk_score} (was {previous})")
+        with self.lock:
+            self.alerts += 1
+            with open(RISK_ALERTS_FILE, 'a') as f:
+                f.write(json.dumps({
+                    "wallet": wallet,
+                    "risk_score": risk_score,
+                    "previous": previous,
+                    "worker": WORKER_ID,
+                    "at": datetime.datetime.now().isoformat()
+                }) + "\n")
+
+
+live_risk = None
+live_risk_lock = threading.Lock()
+
+
+def get_live_risk():
+    global live_risk
+    with live_risk_lock:
+        if live_risk is None:
+            live_risk = LiveRiskScorer()
+    return live_risk
 
 
 def insert_token_transfers(transfers):
     if not transfers:
         print("No token transfers to insert")
-        return
+        return 0
 
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
-
-        inserted = 0
-        for transfer in transfers:
-            try:
-                cursor.execute("""
-                    INSERT INTO token_transfers (
-                        tx_hash, block_number, timestamp,
-                        token_address, from_address, to_address,
-                        value_token, token_name, token_symbol, token_decimals
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (tx_hash, token_address, from_address, to_address) DO NOTHING;
-                """, (
-                    transfer.get('hash', ''),
-                    int(transfer.get('blockNumber', 0)),
-                    datetime.datetime.fromtimestamp(int(transfer.get('timeStamp', 0))),
-                    transfer.get('contractAddress', ''),
-                    transfer.get('from', ''),
-                    transfer.get('to', ''),
-                    float(transfer.get('value', '0')) / (10 ** int(transfer.get('tokenDecimal', 18))),
-                    transfer.get('tokenName', ''),
-                    transfer.get('tokenSymbol', ''),
-                    int(transfer.get('tokenDecimal', 18))
-                ))
-                inserted += 1
-
-                if inserted % 100 == 0:
-                    conn.commit()
-                    print(f"Committed {inserted} token transfers so far")
-            except Exception as e:
-                print(f"Error inserting token transfer {transfer.get('hash', 'unknown')}: {e}")
-
-        conn.commit()
-        print(f"Successfully inserted {inserted} token transfers")
-    except Exception as e:
-        print(f"Database error: {e}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
+    return bulk_load(
+        "token_transfers",
+        ["tx_hash", "block_number", "timestamp", "token_address", "from_address", "to_address",
+         "value_raw", "token_name", "token_symbol", "token_decimals"],
+        ["tx_hash", "token_address", "from_address", "to_address", "block_number"],
+        convert_rows(transfers, token_transfer_row, "token transfer")
+    )
 
 
 def insert_internal_transactions(internal_txs):
     if not internal_txs:
         print("No internal transactions to insert")
-        return
+        return 0
+
+    return bulk_load(
+        "eth_internal_txs",
+        ["tx_hash", "block_number", "timestamp", "from_address", "to_address", "value_wei",
+         "trace_id", "error", "call_type"],
+        ["tx_hash", "trace_id", "block_number"],
+        convert_rows(internal_txs, internal_transaction_row, "internal tx")
+    )
 
+
+def insert_address_label(address, label, category):
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                now = datetime.datetime.now()
 
-        inserted = 0
-        for tx in internal_txs:
-            try:
                 cursor.execute("""
-                    INSERT INTO eth_internal_txs (
-                        tx_hash, block_number, timestamp,
-                        from_address, to_address, value_eth,
-                        trace_id, error, call_type
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (tx_hash, trace_id) DO NOTHING;
+                    INSERT INTO address_labels (
+                        address, label, category, known_entity, first_seen, last_seen
+                    ) VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (address) DO UPDATE SET
+                        label = EXCLUDED.label,
+                        category = EXCLUDED.category,
+                        last_seen = EXCLUDED.last_seen,
+                        ingest_xid = pg_current_xact_id();
                 """, (
-                    tx.get('hash', ''),
-                    int(tx.get('blockNumber', 0)),
-                    datetime.datetime.fromtimestamp(int(tx.get('timeStamp', 0))),
-                    tx.get('from', ''),
-                    tx.get('to', ''),
-                    float(tx.get('value', '0')) / 1e18,
-                    tx.get('traceId', ''),
-                    tx.get('isError', ''),
-                    tx.get('type', '')
+                    hex_to_bytes(address),
+                    label,
+                    category,
+                    True,
+                    now,
+                    now
                 ))
-                inserted += 1
 
-                # Commit in batches
-                if inserted % 100 == 0:
-                    conn.commit()
-                    print(f"Committed {inserted} internal transactions so far")
-            except Exception as e:
-                print(f"Error inserting internal tx {tx.get('hash', 'unknown')}: {e}")
-
-        conn.commit()
-        print(f"Successfully inserted {inserted} internal transactions")
+            conn.commit()
     except Exception as e:
-        print(f"Database error: {e}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
-
+        print(f"Error inserting address label: {e}")
 
-def insert_address_label(address, label, category):
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
 
-        now = datetime.datetime.now()
-
-        cursor.execute("""
-            INSERT INTO address_labels (
-                address, label, category, known_entity, first_seen, last_seen
-            ) VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (address) DO UPDATE SET
-                label = EXCLUDED.label,
-                category = EXCLUDED.category,
-                last_seen = EXCLUDED.last_seen;
-        """, (
-            address.lower(),
-            label,
-            category,
-            True,
-            now,
-            now
-        ))
-
-        conn.commit()
-    except Exception as e:
-        print(f"Error inserting address label: {e}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
+# The process_* functions stream pages straight from the API into the database and
+# return the finished IngestionPipeline (row count, suspicious hashes, wallet candidates)
+def process_regular_transactions(address, period, action="txlist", track_wallets=False):
+    start_block, end_block = get_period_blocks(period)
 
+    if not start_block or not end_block:
+        print(f"Could not determine block numbers for period {period['name']}")
+        return None
 
-def process_regular_transactions(address, period, action="txlist"):
-    transactions = get_transactions_by_time_period(address, period, action)
+    print(f"Fetching {action} for {period['name']} (Blocks {start_block} to {end_block})")
+    ingest = stream_ingest(address, start_block, end_block, action, classify=True, track_wallets=track_wallets)
 
-    if not transactions:
+    if not ingest.rows:
         print(f"No transactions found for {address} in period {period['name']}")
-        return []
 
-    insert_transactions(transactions)
-
-    return transactions
+    return ingest
 
 def process_token_transfers(address, period):
-    start_date = datetime.datetime.fromisoformat(period["start_date"])
-    end_date = datetime.datetime.fromisoformat(period["end_date"])
-
-    start_timestamp = int(start_date.timestamp())
-    end_timestamp = int(end_date.timestamp())
-
-    start_block = timestamp_to_block(start_timestamp)
-    end_block = timestamp_to_block(end_timestamp)
+    start_block, end_block = get_period_blocks(period)
 
     if not start_block or not end_block:
         print(f"Could not determine block numbers for period {period['name']}")
-        return []
+        return None
 
     print(f"Fetching token transfers for {period['name']} (Blocks {start_block} to {end_block})")
-    token_transfers = get_token_transfers(address, start_block, end_block)
+    ingest = stream_ingest(address, start_block, end_block, "tokentx")
 
-    if not token_transfers:
+    if not ingest.rows:
         print(f"No token transfers found for {address} in period {period['name']}")
-        return []
-
-    insert_token_transfers(token_transfers)
 
-    return token_transfers
+    return ingest
 
 
 def process_internal_transactions(address, period):
-    start_date = datetime.datetime.fromisoformat(period["start_date"])
-    end_date = datetime.datetime.fromisoformat(period["end_date"])
-
-    start_timestamp = int(start_date.timestamp())
-    end_timestamp = int(end_date.timestamp())
-
-    start_block = timestamp_to_block(start_timestamp)
-    end_block = timestamp_to_block(end_timestamp)
+    start_block, end_block = get_period_blocks(period)
 
     if not start_block or not end_block:
         print(f"Could not determine block numbers for period {period['name']}")
-        return []
+        return None
 
     print(f"Fetching internal transactions for {period['name']} (Blocks {start_block} to {end_block})")
-    internal_txs = get_internal_transactions_by_address(address, start_block, end_block)
+    ingest = stream_ingest(address, start_block, end_block, "txlistinternal")
 
-    if not internal_txs:
+    if not ingest.rows:
         print(f"No internal transactions found for {address} in period {period['name']}")
-        return []
-
-    insert_internal_transactions(internal_txs)
 
-    return internal_txs
+    return ingest
 
-def process_wallet_addresses(regular_txs, period):
-    wallet_addresses = get_wallet_addresses_from_transactions(regular_txs)
+def process_wallet_addresses(regular_ingest, period):
+    wallet_addresses = top_wallet_candidates(regular_ingest.wallet_counts) if regular_ingest else []
 
     if not wallet_addresses:
         print("No wallet addresses identified for tracking")
@@ -699,18 +1501,180 @@ def process_wallet_addresses(regular_txs, period):
         insert_address_label(address, f"Wallet {i + 1}", "Individual Wallet")
 
         print(f"Processing wallet address: {address}")
-        wallet_txs = process_regular_transactions(address, period)
+        process_regular_transactions(address, period)
 
         process_token_transfers(address, period)
 
         process_internal_transactions(address, period)
 
+def get_traced_hashes(tx_hashes):
+    if not tx_hashes:
+        return set()
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT DISTINCT tx_hash FROM eth_internal_txs WHERE tx_hash = ANY(%s)",
+                               ([hex_to_bytes(tx_hash) for tx_hash in tx_hashes],))
+                return {bytes_to_hex(row[0]) for row in cursor.fetchall()}
+    except Exception as e:
+        print(f"Error checking existing traces: {e}")
+        return set()
+
+
+# Traces suspicious transactions, skipping hashes whose internal transactions are already in
+# eth_internal_txs or in this run's address-level results. Missing traces are fetched
+# concurrently, within TRACE_CALL_BUDGET calls per run.
+def trace_suspicious_transactions(suspicious_txs, known_internal_txs=None):
+    global trace_calls_made
+
+    tx_hashes = list(dict.fromkeys(stx.get('hash') for stx in suspicious_txs if stx.get('hash')))
+    if not tx_hashes:
+        return []
+
+    known = {tx.get('hash') for tx in (known_internal_txs or [])}
+    known |= get_traced_hashes([h for h in tx_hashes if h not in known])
+    missing = [h for h in tx_hashes if h not in known]
+
+    remaining = max(TRACE_CALL_BUDGET - trace_calls_made, 0)
+    to_fetch = missing[:remaining]
+    trace_calls_made += len(to_fetch)
+
+    print(f"Tracing {len(tx_hashes)} suspicious transactions: {len(tx_hashes) - len(missing)} already traced, "
+          f"fetching {len(to_fetch)}, {len(missing) - len(to_fetch)} skipped by the trace budget")
+
+    traces = [tx for internal_txs in fetch_concurrently(get_internal_transactions, to_fetch) for tx in internal_txs]
+    if traces:
+        insert_internal_transactions(traces)
+    return traces
+
+
+ACTION_LOADERS = {
+    "txlist": insert_transactions,
+    "tokentx": insert_token_transfers,
+    "txlistinternal": insert_internal_transactions
+}
+
+
+# Streaming ingestion: fetch workers put pages on a bounded queue (blocking when it is full),
+# a loader thread classifies them, coalesces them into COPY_BATCH_SIZE batches and loads them.
+# Memory stays at a few pages however long the period is, and loading overlaps fetching.
+class IngestionPipeline:
+    def __init__(self, action, classify=False, track_wallets=False):
+        self.loader = ACTION_LOADERS[action]
+        self.classify = classify
+        self.risk = get_live_risk() if classify and action == "txlist" else None
+        self.track_wallets = track_wallets
+        self.pages = queue.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+        self.rows = 0
+        self.suspicious = []
+        self.wallet_counts = {}
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, txs):
+        if self.error:
+            raise self.error
+        if txs:
+            self.pages.put(txs)
+
+    def run(self):
+        batch = []
+        while True:
+            page = self.pages.get()
+            if page is None:
+                break
+            if self.error:
+                continue
+            try:
+                self.process(page)
+                batch.extend(page)
+                if len(batch) >= COPY_BATCH_SIZE:
+                    self.load(batch)
+                    batch = []
+            except Exception as e:
+                self.error = e
+        if batch and not self.error:
+            try:
+                self.load(batch)
+            except Exception as e:
+                self.error = e
+
+    # Classified transactions also feed the live risk counters, counting only rows that were new
+    def load(self, batch):
+        if self.risk:
+            self.loader(batch, on_new=self.risk.update)
+        else:
+            self.loader(batch)
+
+    def process(self, page):
+        self.rows += len(page)
+        if self.classify:
+            for tx in analyze_and_extract_suspicious(page):
+                self.suspicious.append({"hash": tx.get('hash'), "flag_reason": tx.get('flag_reason')})
+        if self.track_wallets:
+            update_wallet_candidates(self.wallet_counts, page)
+
+    def close(self):
+        self.pages.put(None)
+        self.thread.join()
+        if self.risk:
+            self.risk.flush(force=True)
+        if self.error:
+            raise self.error
+        return self
+
+
+def stream_ingest(address, start_block, end_block, action, classify=False, track_wallets=False):
+    pipeline = IngestionPipeline(action, classify, track_wallets)
+    try:
+        paginate_blocks(address, start_block, end_block, action, sink=pipeline.put)
+    finally:
+        pipeline.close()
+    return pipeline
+
+
+# Rebuilds the database tables from the response store alone, without any API calls
+def replay_response_store():
+    for action, loader in ACTION_LOADERS.items():
+        action_dir = os.path.join(RESPONSE_STORE_DIR, "account", action)
+        if not os.path.isdir(action_dir):
+            print(f"No stored {action} responses")
+            continue
+
+        files = 0
+        for root, _, filenames in os.walk(action_dir):
+            for filename in sorted(filenames):
+                if not filename.endswith(".json.gz"):
+                    continue
+                try:
+                    with gzip.open(os.path.join(root, filename), 'rt') as f:
+                        result = stored_result(json.load(f))
+                except Exception as e:
+                    print(f"Skipping unreadable stored response {filename}: {e}")
+                    continue
+                if result:
+                    # Regular transactions are classified as during live ingestion, so tx_type
+                    # and the live risk counters match
+                    if action == "txlist":
+                        analyze_and_extract_suspicious(result)
+                        loader(result, on_new=get_live_risk().update)
+                    else:
+                        loader(result)
+                files += 1
+
+        print(f"Replayed {files} stored {action} responses")
+    get_live_risk().flush(force=True)
+
+
 def clear_database():
     try:
         conn = psycopg2.connect(**DB_PARAMS)
         cursor = conn.cursor()
 
-        tables = ["internal_transactions", "token_transfers", "eth_internal_txs", "address_labels"]
+        tables = ["internal_transactions", "token_transfers", "eth_internal_txs", "address_labels", "wallet_aggregates",
+                  "wallet_risk_live"]
 
         for table in tables:
             cursor.execute(f"TRUNCATE TABLE {table} CASCADE;")
@@ -735,6 +1699,9 @@ def main():
 
     # Ensure tables exist
     ensure_tables_exist()
+    ensure_task_queue()
+    requeue_stale_tasks()
+    requeue_unfinalized_tasks()
 
     # Check if we should resume from previous state
     saved_state = load_state()
@@ -749,6 +1716,7 @@ def main():
     clear_data = input("\nDo you want to clear existing data in the database? (y/n): ").lower()
     if clear_data == 'y':
         clear_database()
+        clear_task_queue()
         print("Database cleared. Starting fresh data collection.")
     else:
         print("Keeping existing data. New data will be added without duplicates.")
@@ -763,8 +1731,9 @@ def main():
     print("3. Token transfers only (focus on ERC-20 token movements)")
     print("4. Internal transactions only (focus on fund flows)")
     print("5. Wallet tracing (identify and trace individual wallets)")
+    print("6. Offline replay (rebuild tables from the local response store, no API calls)")
 
-    choice = input("Enter choice (1-5): ")
+    choice = input("Enter choice (1-6): ")
 
     if choice == "1":
         print("\nRunning focused collection...")
@@ -789,7 +1758,7 @@ def main():
                 print(f"\nProcessing {contract_name} for {period['name']}:")
 
                 print("\n> Processing regular transactions...")
-                regular_txs = process_regular_transactions(contract_address, period)
+                regular_ingest = process_regular_transactions(contract_address, period, track_wallets=True)
 
                 print("\n> Processing token transfers...")
                 process_token_transfers(contract_address, period)
@@ -798,7 +1767,7 @@ def main():
                 process_internal_transactions(contract_address, period)
 
                 print("\n> Processing wallet addresses...")
-                process_wallet_addresses(regular_txs, period)
+                process_wallet_addresses(regular_ingest, period)
 
                 if api_calls_made > MAX_API_CALLS_PER_DAY * 0.8:
                     print("⚠️ Approaching API limit. Saving progress and exiting.")
@@ -826,7 +1795,7 @@ def main():
                 print(f"\nProcessing contract: {contract_name} ({contract_address})")
 
                 print("> Processing regular transactions...")
-                txs = process_regular_transactions(contract_address, period)
+                regular_ingest = process_regular_transactions(contract_address, period)
 
                 print("> Processing token transfers...")
                 process_token_transfers(contract_address, period)
@@ -834,15 +1803,9 @@ def main():
                 print("> Processing internal transactions...")
                 process_internal_transactions(contract_address, period)
 
-                suspicious_txs = analyze_and_extract_suspicious(txs)
-
-                for stx in suspicious_txs[:10]:
-                    tx_hash = stx.get('hash')
-                    print(f"Investigating suspicious transaction: {tx_hash}")
-
-                    internal_txs = get_internal_transactions(tx_hash)
-                    if internal_txs:
-                        insert_internal_transactions(internal_txs)
+                # Address-level internal transactions are already loaded, so the tracer finds them in eth_internal_txs
+                print("> Tracing suspicious transactions...")
+                trace_suspicious_transactions(regular_ingest.suspicious if regular_ingest else [])
 
                 if api_calls_made > MAX_API_CALLS_PER_DAY * 0.8:
                     print("Approaching API limit. Saving progress and exiting.")
@@ -915,12 +1878,19 @@ def main():
 
         print(f"\nProcessing {contract_name} for {selected_period['name']} to identify wallets:")
 
-        regular_txs = process_regular_transactions(contract_address, selected_period)
+        regular_ingest = process_regular_transactions(contract_address, selected_period, track_wallets=True)
 
         print("\nProcessing identified wallet addresses...")
-        process_wallet_addresses(regular_txs, selected_period)
+        process_wallet_addresses(regular_ingest, selected_period)
+
+    elif choice == "6":
+        print(f"\nReplaying stored responses from {RESPONSE_STORE_DIR}...")
+        replay_response_store()
 
     print(f"\nScript completed with {api_calls_made} API calls.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--worker" in sys.argv:
+        drain_task_queue()
+    else:
+        main()
\ No newline at end of file